@@ -0,0 +1,88 @@
+"""
+Accuracy versus speed report of solver accuracy profiles.
+
+Random sample of scan grid is solved with every profile in
+ACCURACY_PROFILES. Results are compared with "reference" profile: change
+in acceptance of feedback, errors in recovery timings and minimum PI4P,
+and speedup.
+"""
+from analysis.feedback_scaling import *
+
+
+def solve_sample(system: str, enzymes: dict, init_con, points: list,
+                 profile: str) -> tuple:
+    """
+    Solves given grid points with given accuracy profile
+    :return: (list of records (None for rejected points), time taken)
+    """
+    start = time.time()
+    no_feed_ss = solve_stage(system, init_con, init_time[-1], enzymes, None,
+                             "steady_state", profile)[-1]
+    no_feed_recovery = get_no_feedback_recovery(system, enzymes, no_feed_ss,
+                                                profile=profile)
+    records = [solve_feedback_point(system, enzymes, init_con, no_feed_ss,
+                                    *p, no_feed_recovery=no_feed_recovery,
+                                    profile=profile, budget_factor=None)
+               for p in points]
+    return records, time.time() - start
+
+
+def compare_records(records: list, reference: list) -> dict:
+    """
+    Compares records of one profile with records of reference profile
+    """
+    flips = sum((a is None) != (b is None) for a, b in
+                zip(records, reference))
+    errors = []
+    recovery_flips = 0
+    min_pi4p_errors = []
+    for a, b in zip(records, reference):
+        if a is None or b is None:
+            continue
+        for key in ["pip2_timings", "pi4p_timings"]:
+            for x, y in zip(a[key], b[key]):
+                if (x == NOT_RECOVERED) != (y == NOT_RECOVERED):
+                    recovery_flips += 1
+                elif x != NOT_RECOVERED:
+                    errors.append(abs(x - y))
+        min_pi4p_errors.append(abs(a["min_pi4p"] - b["min_pi4p"]) /
+                               b["min_pi4p"])
+    report = {"acceptance_flip_rate": flips / len(reference),
+              "recovery_flips": recovery_flips}
+    if len(errors) > 0:
+        report["mean_timing_error"] = float(np.mean(errors))
+        report["max_timing_error"] = float(np.max(errors))
+        report["max_relative_min_pi4p_error"] = float(
+            np.max(min_pi4p_errors))
+    return report
+
+
+def accuracy_report(filename: str, system: str, samples: int = 100,
+                    seed: int = 0) -> dict:
+    """
+    Runs sampled grid with every accuracy profile and logs comparison with
+    "reference" profile
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param samples: number of grid points
+    :param seed: seed of random sample
+    :return: report dictionary
+    """
+    enzymes = get_scaled_enzymes(filename, system)
+    init_con = get_random_concentrations(1, system)
+    points = get_scan_plan().sample(samples, seed)
+    results = {}
+    for profile in ACCURACY_PROFILES:
+        results[profile] = solve_sample(system, enzymes, init_con, points,
+                                        profile)
+
+    reference, reference_time = results["reference"]
+    report = {}
+    for profile in results:
+        records, taken = results[profile]
+        report[profile] = compare_records(records, reference)
+        report[profile]["time_per_point"] = taken / samples
+        report[profile]["speedup"] = reference_time / taken
+        report[profile]["accepted"] = sum(x is not None for x in records)
+    LOG.info(json.dumps(report, sort_keys=True))
+    return report
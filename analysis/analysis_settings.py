@@ -5,9 +5,64 @@ from constants.namespace import *
 SYSTEM = S_OPEN_2
 PERCENTAGE_DEPLETION = 85
 
+# If True, stimulus is given by stimulating PLC till PERCENTAGE_DEPLETION
+# is reached (helper.give_plc_stimulus). Otherwise approximate
+# helper.give_stimulus is used.
+EXACT_STIMULUS = True
+PLC_STIMULATION_FACTOR = 100
+STIMULATION_MAX_TIME = 100
+
 # First recovery point is 16 which is immediately after 15% depletion
 # 76.5 is 90% of whatever is left after 15% depletion
 RECOVERY_POINTS = [20, 30, 50, 76.5, 90, 100]  # Get data at these points
+# Timing stored when lipid never reaches recovery point
+NOT_RECOVERED = -1989
+
+# Solver accuracy profiles for every stage of scan
+# steady_state : steady state without feedback
+# verification : steady state with feedback (used to accept feedback)
+# recovery : stimulus and recovery
+# "standard" is same as odeint defaults used earlier
+# "fast" only loosens verification: its cost is in transient from random
+# initial condition (not in horizon or output points) and only final state
+# is used for rough acceptance check. Recovery is same as in "standard".
+ACCURACY_PROFILE = "standard"
+ACCURACY_PROFILES = {
+    "fast": {
+        "steady_state": {"rtol": 1.49012e-8, "atol": 1.49012e-8,
+                         "points": 100, "mxstep": 0},
+        "verification": {"rtol": 1e-4, "atol": 1e-8, "points": 100,
+                         "mxstep": 5000},
+        "recovery": {"rtol": 1.49012e-8, "atol": 1.49012e-8,
+                     "points": 3000, "mxstep": 0}},
+    "standard": {
+        "steady_state": {"rtol": 1.49012e-8, "atol": 1.49012e-8,
+                         "points": 10000, "mxstep": 0},
+        "verification": {"rtol": 1.49012e-8, "atol": 1.49012e-8,
+                         "points": 10000, "mxstep": 0},
+        "recovery": {"rtol": 1.49012e-8, "atol": 1.49012e-8,
+                     "points": 3000, "mxstep": 0}},
+    "reference": {
+        "steady_state": {"rtol": 1e-11, "atol": 1e-13, "points": 10000,
+                         "mxstep": 50000},
+        "verification": {"rtol": 1e-11, "atol": 1e-13, "points": 10000,
+                         "mxstep": 50000},
+        "recovery": {"rtol": 1e-11, "atol": 1e-13, "points": 30000,
+                     "mxstep": 50000}}
+}
+
+# Steady state without feedback is calculated from flux balance (closed
+# form, see helper.get_flux_balance_ss) for systems which have it. Set False
+# to always integrate.
+FLUX_BALANCE_STEADY_STATE = True
+# Maximum relative difference between flux balance and integrated steady
+# state in validation
+FLUX_BALANCE_TOLERANCE = 1e-6
+
+# Recovery points are lowered by this relative tolerance.
+# Non-zero value makes 100% timing of lipid approaching its steady state
+# from below independent of numerical noise, but changes stored timings.
+RECOVERY_THRESHOLD_TOLERANCE = 0
 
 # Initialization and some base constants and their ranges
 RANGE_HILL_COEFFICIENT = [0.5, 1, 2]
@@ -33,3 +88,80 @@ COLORS_SECONDARY = ["#F0F4C3", "#F8BBD0", "#E1BEE7", "#D1C4E9",
                     "#C5CAE9", "#BBDEFB", "#B3E5FC", "#B2EBF2", "#B2DFDB",
                     "#C8E6C9", "#FFCDD2",
                     "#DCEDC8"]
+
+# Surrogate model settings
+# Length scale of RBF kernel in normalized (log) parameter space
+SURROGATE_LENGTH_SCALE = 0.3
+SURROGATE_NOISE = 1e-6
+# Points with normalized posterior standard deviation above this value are
+# sent to real solver
+SURROGATE_MAX_UNCERTAINTY = 0.2
+
+# Fixed bin edges of summary histograms (see analysis/summary.py).
+# Ratio of timings is mostly close to 1: bins are ~1 % wide between 1/2 and
+# 2 (1 is in the middle of a bin) and ~25 % wide outside. Minimum of PI4P
+# is divided by its steady state without feedback. Timing edges are
+# log-spaced over recovery time (see summary.get_histogram_edges).
+HISTOGRAM_EDGES = {
+    "diff": np.concatenate((np.logspace(-2, -0.3025, 18)[:-1],
+                            np.logspace(-0.3025, 0.3025, 122),
+                            np.logspace(0.3025, 2, 18)[1:])),
+    "min_pi4p_ratio": np.linspace(0, 1.2, 241)
+}
+HISTOGRAM_TIMING_BINS = 200  # ~5 % wide bins
+
+# Live analysis of running scan
+LIVE_REFRESH_INTERVAL = 60  # Seconds between two summaries
+
+# Merging of sharded scans
+SHARD_ENZYME_TOLERANCE = 1e-3  # Relative tolerance between scaled enzymes
+# Analysis details which should be same in all shards
+SHARD_SETTINGS = ["system", "recovery_points", "depletion_percentage",
+                  "recovery_threshold_tolerance", "exact_stimulus",
+                  "plc_stimulation_factor", "stimulation_max_time",
+                  "accuracy_profile", "solver_settings",
+                  "flux_balance_steady_state", "sub_version", "version"]
+
+# Distributed scan (see analysis/work_queue.py)
+QUEUE_CHUNK_SIZE = 50  # Grid points in single task
+QUEUE_LEASE_TIME = 600  # Seconds after which unfinished task is re-assigned
+QUEUE_MAX_ATTEMPTS = 3  # Task is marked failed after these many leases
+QUEUE_POLL_INTERVAL = 5  # Seconds worker waits when all tasks are leased
+
+# Trajectory archive (see analysis/trajectory.py)
+TRAJECTORY_SAMPLES = 256  # Time points stored for every recovery curve
+TRAJECTORY_CHUNK_SIZE = 1000  # Grid points in single chunk file
+
+# Continuation of feedback steady states (see analysis/continuation.py)
+# Steps are in log10 of parameter and concentrations
+CONTINUATION_INITIAL_STEP = 0.05
+CONTINUATION_MAX_STEP = 0.2
+CONTINUATION_MIN_STEP = 1e-5
+CONTINUATION_MAX_POINTS = 500
+CONTINUATION_MAX_NEWTON = 8
+CONTINUATION_TOLERANCE = 1e-10
+CONTINUATION_DIFF_STEP = 1e-6  # Step of central differences in Jacobian
+# Branch is stopped when any concentration is this many decades away from
+# steady state without feedback
+CONTINUATION_MAX_DECADES = 6
+CONTINUATION_BISECTIONS = 30  # Refinement of branch points
+
+# Global sensitivity analysis (see analysis/sensitivity.py)
+SENSITIVITY_SAMPLES = 32  # Base Sobol samples (power of 2)
+SENSITIVITY_BOOTSTRAP = 200  # Resamples for confidence intervals
+SENSITIVITY_CONFIDENCE = 0.95
+# PIP2 recovery point used as response. Should be well below 100: PIP2
+# approaches its steady state from below and crosses 100 % only by
+# integration error.
+SENSITIVITY_RECOVERY_POINT = 90
+
+# Budgets of single scan point (see feedback_scaling.SolveBudget). Points
+# which exceed them are recorded with outcome OUTCOME_BUDGET_EXCEEDED and
+# retried after the main scan (slow lane) with budgets multiplied by
+# SLOW_LANE_BUDGET_FACTOR.
+SOLVE_BUDGETS = {
+    "verification": {"evaluations": 50000, "wall_time": 10},
+    "stimulus": {"evaluations": 10000, "wall_time": 5},
+    "recovery": {"evaluations": 50000, "wall_time": 10}}
+SLOW_LANE_BUDGET_FACTOR = 10
+OUTCOME_BUDGET_EXCEEDED = "budget_exceeded"
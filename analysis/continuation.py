@@ -0,0 +1,481 @@
+"""
+Parameter continuation of feedback steady states.
+
+Steady state branch is traced against one feedback parameter
+(carrying capacity "c" or multiplication factor "a") with pseudo-arclength
+continuation and adaptive step length. Vmax of feedback enzyme is
+corrected at every parameter value exactly as in the scan.
+
+Because of this correction, steady state without feedback is a solution
+for every parameter value (except for feedback on source, whose rate does
+not depend on Vmax). Its branch is a straight line in parameter: there
+are no folds on it and it is always accepted by the scan, hence only Hopf
+points, branch points and stability changes can be found on it.
+Scan rejects a point when integration from its initial condition reaches
+some other steady state (or diverges). Such alternative branches are
+traced from branch points and from integrated steady states; their folds,
+branch points with branch without feedback and parameter values where
+they escape to infinity give boundaries of rejected region.
+
+Continuation is done in log space (log10 of concentrations and of
+parameter) because concentrations and parameters span several orders of
+magnitude. Jacobian is calculated with central differences of system
+equations. Eigenvalues of Jacobian are used to detect change in
+stability and Hopf points (complex pair crossing imaginary axis). Real
+eigenvalue crossing zero changes sign of determinant of Jacobian; it is a
+fold if parameter direction of tangent changes sign too, otherwise it is
+a branch point. Branch crossing the branch without feedback is followed
+from its branch points along null vector of Jacobian.
+"""
+from itertools import product
+
+from analysis.feedback_scaling import *
+
+FEEDBACK_AXES = [F_CARRYING_CAPACITY, F_MULTIPLICATION_FACTOR]
+
+
+class FeedbackBranch:
+    """
+    Steady state equations of single feedback as function of one of its
+    parameters
+    """
+
+    def __init__(self, system: str, enzymes: dict, no_feed_ss, hill, carry,
+                 multi, fed_type, sub_ind, enz, axis: str):
+        if axis not in FEEDBACK_AXES:
+            raise Exception("Continuation is possible only along %s" %
+                            FEEDBACK_AXES)
+        self.system = system
+        self.equations = get_equations(system)
+        self.enzymes = enzymes
+        self.no_feed_ss = no_feed_ss
+        self.para = {F_HILL_COEFFICIENT: hill, F_CARRYING_CAPACITY: carry,
+                     F_MULTIPLICATION_FACTOR: multi}
+        self.fed_type = fed_type
+        self.sub_ind = sub_ind
+        self.enz = enz
+        self.axis = axis
+
+    def feedback(self, p) -> tuple:
+        """
+        :return: (feed_para, Vmax correction factor) at parameter value p
+        """
+        para = dict(self.para)
+        para[self.axis] = p
+        hill = para[F_HILL_COEFFICIENT]
+        carry = para[F_CARRYING_CAPACITY]
+        multi = para[F_MULTIPLICATION_FACTOR]
+        feed_para = make_feed_para(hill, carry, multi, self.fed_type,
+                                   self.sub_ind, self.enz)
+        fed_factor = get_correction_factor(self.no_feed_ss, hill, carry,
+                                           multi, self.fed_type,
+                                           self.sub_ind)
+        return feed_para, fed_factor
+
+    def rhs(self, x, p) -> np.ndarray:
+        """
+        Rates of change of all lipids at parameter value p
+        """
+        feed_para, fed_factor = self.feedback(p)
+        enzyme = self.enzymes[self.enz]  # type: Enzyme
+        original = enzyme.v
+        enzyme.v = original * fed_factor
+        try:
+            return np.asarray(self.equations(list(x), 0, self.enzymes,
+                                             feed_para))
+        finally:
+            enzyme.v = original
+
+    def integrate(self, init_con, p) -> np.ndarray:
+        """
+        State reached from init_con at parameter value p (same integration
+        as verification of steady state in the scan)
+        """
+        feed_para, fed_factor = self.feedback(p)
+        enzyme = self.enzymes[self.enz]  # type: Enzyme
+        original = enzyme.v
+        enzyme.v = original * fed_factor
+        try:
+            return solve_stage(self.system, init_con, init_time[-1],
+                               self.enzymes, feed_para, "verification")[-1]
+        finally:
+            enzyme.v = original
+
+    def log_rhs(self, u) -> np.ndarray:
+        """
+        Steady state equations in log space, u = (log10 x, log10 p)
+        """
+        x = np.power(10, u[:-1])
+        return self.rhs(x, np.power(10, u[-1])) / x
+
+    def jacobian(self, u) -> np.ndarray:
+        """
+        Jacobian of log_rhs (8 x 9) with central differences
+        """
+        columns = []
+        for i in range(len(u)):
+            step = np.zeros(len(u))
+            step[i] = CONTINUATION_DIFF_STEP
+            columns.append((self.log_rhs(u + step) - self.log_rhs(u - step))
+                           / (2 * CONTINUATION_DIFF_STEP))
+        return np.stack(columns, axis=1)
+
+    def eigenvalues(self, u) -> np.ndarray:
+        """
+        Eigenvalues of Jacobian of original system at steady state.
+        At steady state, Jacobian in log space is similar to it.
+        """
+        return np.linalg.eigvals(self.jacobian(u)[:, :-1] * np.log(10))
+
+
+def _tangent(jac: np.ndarray, orientation) -> np.ndarray:
+    """
+    Unit tangent of branch, oriented along previous tangent (or along
+    initial orientation)
+    """
+    tangent = np.linalg.svd(jac)[2][-1]
+    if tangent.dot(orientation) < 0:
+        tangent = -tangent
+    return tangent
+
+
+def _correct(branch: FeedbackBranch, u, tangent=None, fixed_para=False):
+    """
+    Newton corrector. If fixed_para is True, parameter is kept constant,
+    otherwise pseudo-arclength condition (orthogonal to tangent) is used.
+    :return: (corrected point or None, number of iterations)
+    """
+    u = np.array(u, dtype=float)
+    start = u.copy()
+    for iteration in range(1, CONTINUATION_MAX_NEWTON + 1):
+        jac = branch.jacobian(u)
+        if fixed_para:
+            delta = np.linalg.lstsq(jac[:, :-1], -branch.log_rhs(u),
+                                    rcond=None)[0]
+            delta = np.append(delta, 0)
+        else:
+            matrix = np.vstack((jac, tangent))
+            residual = np.append(branch.log_rhs(u),
+                                 tangent.dot(u - start))
+            delta = np.linalg.solve(matrix, -residual)
+        u = u + delta
+        if not np.all(np.isfinite(u)):
+            return None, iteration
+        if max(abs(delta)) < CONTINUATION_TOLERANCE:
+            return u, iteration
+    return None, CONTINUATION_MAX_NEWTON
+
+
+def _stability(eigenvalues: np.ndarray) -> dict:
+    unstable = eigenvalues.real > 0
+    complex_pair = abs(eigenvalues.imag) > 1e-10
+    real = eigenvalues.real[~complex_pair]
+    return {"unstable_real": int(np.sum(unstable & ~complex_pair)),
+            "unstable_complex": int(np.sum(unstable & complex_pair)),
+            "max_real": float(max(eigenvalues.real)),
+            # Real eigenvalue which crosses zero at fold or branch point
+            "nearest_real": float(real[np.argmin(abs(real))]) if len(
+                real) > 0 else np.nan}
+
+
+def _trace(branch: FeedbackBranch, u, low: float, high: float,
+           orientation) -> dict:
+    """
+    Pseudo-arclength continuation from corrected point u till parameter
+    leaves [low, high] (in log10)
+    :param orientation: initial direction of tangent
+    """
+    log_ss = np.log10(branch.no_feed_ss)
+    points = []
+    events = []
+    tangent = np.asarray(orientation, dtype=float)
+    step = CONTINUATION_INITIAL_STEP
+    previous = None
+    while len(points) < CONTINUATION_MAX_POINTS:
+        jac = branch.jacobian(u)
+        tangent = _tangent(jac, tangent)
+        current = {"parameter": float(np.power(10, u[-1])),
+                   "state": list(np.power(10, u[:-1])),
+                   "accepted": is_same_steady_state(branch.no_feed_ss,
+                                                    np.power(10, u[:-1])),
+                   "direction": float(tangent[-1]),
+                   "det_sign": float(np.sign(np.linalg.det(jac[:, :-1])))}
+        current.update(_stability(branch.eigenvalues(u)))
+        points.append(current)
+        if previous is not None:
+            events.extend(_detect_events(previous, current))
+        previous = current
+        if not low <= u[-1] <= high and len(points) > 1:
+            break
+        if max(abs(u[:-1] - log_ss)) > CONTINUATION_MAX_DECADES:
+            # Steady state escapes to infinity (integration diverges)
+            events.append({"type": "unbounded",
+                           "parameter": current["parameter"]})
+            break
+
+        while True:
+            guess = u + step * tangent
+            new_u, iterations = _correct(branch, guess, tangent)
+            if new_u is not None:
+                break
+            step /= 2
+            if step < CONTINUATION_MIN_STEP:
+                LOG.info("Continuation stopped at %s = %.4g" % (
+                    branch.axis, current["parameter"]))
+                return {"points": points, "events": events}
+        u = new_u
+        if iterations <= 3:
+            step = min(step * 1.5, CONTINUATION_MAX_STEP)
+
+    return {"points": points, "events": events}
+
+
+def trace_branch(branch: FeedbackBranch, start: float, stop: float,
+                 initial_guess) -> dict:
+    """
+    Traces steady state branch from parameter value start towards stop.
+    Branch without feedback should be followed with
+    trace_no_feedback_branch instead (continuation can turn to other
+    branch at branch point).
+    :param branch: feedback branch
+    :param start: starting value of parameter
+    :param stop: end value of parameter
+    :param initial_guess: steady state guess at start
+    :return: dictionary with list of branch "points" and "events"
+    (fold, branch, hopf, stability and acceptance changes, and "unbounded"
+    if steady state escapes to infinity) with their estimated parameter
+    value
+    """
+    low, high = sorted([np.log10(start), np.log10(stop)])
+    u, _ = _correct(branch, np.append(np.log10(initial_guess),
+                                      np.log10(start)), fixed_para=True)
+    if u is None:
+        raise Exception("Steady state not found at starting parameter")
+    orientation = np.zeros(len(u))
+    orientation[-1] = 1 if stop >= start else -1
+    return _trace(branch, u, low, high, orientation)
+
+
+def _no_feedback_point(branch: FeedbackBranch, log_p: float) -> dict:
+    u = np.append(np.log10(branch.no_feed_ss), log_p)
+    if max(abs(branch.log_rhs(u))) > 1e-8:
+        raise Exception("Steady state without feedback is not steady state "
+                        "at %s = %.4g" % (branch.axis, np.power(10, log_p)))
+    point = {"parameter": float(np.power(10, log_p)),
+             "det_sign": float(np.sign(np.linalg.det(
+                 branch.jacobian(u)[:, :-1])))}
+    point.update(_stability(branch.eigenvalues(u)))
+    return point
+
+
+def trace_no_feedback_branch(branch: FeedbackBranch, start: float,
+                             stop: float) -> dict:
+    """
+    Follows steady state without feedback (same for every parameter
+    value because of Vmax correction) from start to stop. It is sampled
+    with CONTINUATION_INITIAL_STEP and branch points are refined by
+    bisection. Parameter never turns on this branch and it is always
+    accepted by the scan, hence there are only branch, hopf and stability
+    events.
+    :return: dictionary with "points" and "events"
+    :raises Exception: if Vmax correction does not keep steady state
+    """
+    low, high = np.log10(start), np.log10(stop)
+    count = int(np.ceil(abs(high - low) / CONTINUATION_INITIAL_STEP)) + 1
+    points = [_no_feedback_point(branch, x) for x in
+              np.linspace(low, high, count)]
+    events = []
+    for first, second in zip(points[:-1], points[1:]):
+        for event in _detect_events(first, second):
+            if event["type"] == "branch":
+                a = np.log10(first["parameter"])
+                b = np.log10(second["parameter"])
+                for _ in range(CONTINUATION_BISECTIONS):
+                    middle = _no_feedback_point(branch, (a + b) / 2)
+                    if middle["det_sign"] == first["det_sign"]:
+                        a = (a + b) / 2
+                    else:
+                        b = (a + b) / 2
+                event["parameter"] = float(np.power(10, (a + b) / 2))
+            events.append(event)
+    return {"points": points, "events": events}
+
+
+def switch_branch(branch: FeedbackBranch, parameter: float, start: float,
+                  stop: float) -> list:
+    """
+    Traces branch crossing steady state without feedback at branch point.
+    Both halves are started along null vector of Jacobian (on each side
+    of steady state without feedback) and traced away from it.
+    :param parameter: parameter value of branch point
+    :param start: one limit of parameter
+    :param stop: other limit of parameter
+    :return: list of traces (see trace_branch)
+    """
+    low, high = sorted([np.log10(start), np.log10(stop)])
+    u = np.append(np.log10(branch.no_feed_ss), np.log10(parameter))
+    null = np.linalg.svd(branch.jacobian(u)[:, :-1])[2][-1]
+    output = []
+    for sign in [1, -1]:
+        orientation = np.append(sign * null, 0)
+        new_u, _ = _correct(branch, u + CONTINUATION_INITIAL_STEP *
+                            orientation, orientation)
+        if new_u is None or max(abs(new_u - u)[:-1]) < \
+                CONTINUATION_INITIAL_STEP / 2:
+            continue
+        output.append(_trace(branch, new_u, low, high, orientation))
+    return output
+
+
+def _interpolate(first: dict, second: dict, key: str) -> float:
+    """
+    Parameter value where key crosses zero (linear in log parameter)
+    """
+    a, b = first[key], second[key]
+    q1, q2 = np.log10(first["parameter"]), np.log10(second["parameter"])
+    if a == b:
+        return float(np.power(10, (q1 + q2) / 2))
+    return float(np.power(10, q1 + (q2 - q1) * a / (a - b)))
+
+
+def _detect_events(first: dict, second: dict) -> list:
+    events = []
+    if "direction" in first and np.sign(first["direction"]) != np.sign(
+            second["direction"]):
+        events.append({"type": "fold",
+                       "parameter": _interpolate(first, second,
+                                                 "direction")})
+    elif first["det_sign"] != second["det_sign"]:
+        events.append({"type": "branch",
+                       "parameter": _interpolate(first, second,
+                                                 "nearest_real")})
+    if first["unstable_complex"] != second["unstable_complex"]:
+        events.append({"type": "hopf",
+                       "parameter": _interpolate(first, second,
+                                                 "max_real")})
+    stable = [x["unstable_real"] + x["unstable_complex"] == 0 for x in
+              [first, second]]
+    if stable[0] != stable[1]:
+        events.append({"type": "stability",
+                       "parameter": _interpolate(first, second,
+                                                 "max_real"),
+                       "stable_after": stable[1]})
+    if "accepted" in first and first["accepted"] != second["accepted"]:
+        events.append({"type": "acceptance",
+                       "parameter": float(np.sqrt(first["parameter"] *
+                                                  second["parameter"])),
+                       "accepted_after": second["accepted"]})
+    return events
+
+
+def trace_alternative_branches(branch: FeedbackBranch, init_con,
+                               values) -> list:
+    """
+    Traces steady states other than one without feedback which are reached
+    by integration from init_con (as in the scan) at given parameter
+    values. Branch found at one value is traced across whole range of
+    values and other values covered by it are not integrated again.
+    :param branch: feedback branch
+    :param init_con: initial condition of scan
+    :param values: parameter values of scan
+    :return: list of dictionaries with "start" (parameter value where
+    branch was found), "range" of parameter covered, "events" and
+    "points" (or "error" if integrated state could not be traced, e.g.
+    when integration diverges)
+    """
+    low, high = min(values), max(values)
+    output = []
+    covered = []
+    for value in sorted(values):
+        if any(a <= value <= b for a, b in covered):
+            continue
+        state = branch.integrate(init_con, value)
+        if is_same_steady_state(branch.no_feed_ss, state):
+            continue
+        try:
+            down = trace_branch(branch, value, low, state)
+            up = trace_branch(branch, value, high, state)
+        except Exception as e:
+            output.append({"start": float(value), "error": str(e)})
+            continue
+        points = down["points"][::-1] + up["points"][1:]
+        covered.append(_get_range(points))
+        output.append({"start": float(value), "range": _get_range(points),
+                       "events": down["events"] + up["events"],
+                       "points": points})
+    return output
+
+
+def _get_range(points: list) -> list:
+    parameters = [x["parameter"] for x in points]
+    return [min(parameters), max(parameters)]
+
+
+def find_feedback_boundaries(filename: str, system: str,
+                             axis: str = F_MULTIPLICATION_FACTOR) -> list:
+    """
+    Traces every feedback configuration of scan along one axis (all values
+    of other parameters are taken from scan ranges) and logs the events.
+    Branch without feedback gives Hopf points, branch points and stability
+    changes. Alternative branches (started at its branch points or at
+    states reached by the scan integration) give folds, acceptance
+    changes and unbounded steady states. Integration is same as
+    verification in the scan, hence this costs about as much as the
+    verification part of scan.
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param axis: F_MULTIPLICATION_FACTOR or F_CARRYING_CAPACITY
+    :return: list of configurations with "events" of branch without
+    feedback and "alternative" branches (with "found_by", "start",
+    "range" and "events")
+    """
+    enzymes = get_scaled_enzymes(filename, system)
+    init_con, no_feed_ss = get_no_feedback_ss(enzymes, system)
+    if axis == F_MULTIPLICATION_FACTOR:
+        axis_range, other_range = RANGE_MULTIPLICATION_FACTOR, RANGE_CARRY
+    else:
+        axis_range, other_range = RANGE_CARRY, RANGE_MULTIPLICATION_FACTOR
+
+    output = []
+    for hill, other, fed_type, sub_ind, enz in product(
+            RANGE_HILL_COEFFICIENT, other_range, RANGE_FEED_TYPE,
+            RANGE_SUBSTRATE, RANGE_ENZYMES):
+        if axis == F_MULTIPLICATION_FACTOR:
+            carry, multi = other, axis_range[0]
+        else:
+            carry, multi = axis_range[0], other
+        branch = FeedbackBranch(system, enzymes, no_feed_ss, hill, carry,
+                                multi, fed_type, sub_ind, enz, axis)
+        configuration = {F_ENZYME: enz, F_FEED_SUBSTRATE_INDEX: sub_ind,
+                         F_TYPE_OF_FEEDBACK: fed_type,
+                         F_HILL_COEFFICIENT: hill,
+                         F_CARRYING_CAPACITY: carry,
+                         F_MULTIPLICATION_FACTOR: multi, "axis": axis}
+        low, high = min(axis_range), max(axis_range)
+        try:
+            result = trace_no_feedback_branch(branch, low, high)
+        except Exception as e:
+            LOG.info("Continuation failed for %s : %s" % (
+                json.dumps(configuration, sort_keys=True), e))
+            configuration["error"] = str(e)
+            result = {"events": []}
+        configuration["events"] = result["events"]
+        alternative = []
+        for event in result["events"]:
+            if event["type"] != "branch":
+                continue
+            for trace in switch_branch(branch, event["parameter"], low,
+                                       high):
+                alternative.append({"found_by": "branch_point",
+                                    "start": event["parameter"],
+                                    "range": _get_range(trace["points"]),
+                                    "events": trace["events"]})
+        for trace in trace_alternative_branches(branch, init_con,
+                                                axis_range):
+            trace.pop("points", None)
+            trace["found_by"] = "integration"
+            alternative.append(trace)
+        configuration["alternative"] = alternative
+        LOG.info(json.dumps(configuration, sort_keys=True))
+        output.append(configuration)
+    return output
@@ -7,23 +7,143 @@ IMPORTANT: We removed all feedback parameter which were not giving steady
 state close to the steady state without feedback
 """
 
-from itertools import product
+import time
+import warnings
 
 from analysis.analysis_settings import *
 from analysis.helper import *
+from analysis.scan_plan import ScanPlan
 from utils.functions import update_progress
 from utils.log import *
 
 recovery_time = np.linspace(0, 100, 3000)
+init_time = np.linspace(0, 10000, 10000)
+
+
+def get_profile(stage: str, profile: str = None) -> dict:
+    """
+    Solver settings of given stage
+    :param stage: "steady_state", "verification" or "recovery"
+    :param profile: name of accuracy profile (default is ACCURACY_PROFILE)
+    :return: dictionary with rtol, atol, points and mxstep
+    """
+    if profile is None:
+        profile = ACCURACY_PROFILE
+    return ACCURACY_PROFILES[profile][stage]
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when integration of single stage exceeds its budget
+    """
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__("Budget of %s stage exceeded (%s)" % (stage, reason))
+        self.stage = stage
+        self.reason = reason
+
+
+class SolveBudget:
+    """
+    Budget of function evaluations and wall time of single stage of single
+    scan point. Equations wrapped by budget stop the integration (with
+    BudgetExceeded) as soon as budget is exceeded.
+    """
+
+    def __init__(self, stage: str, factor: float = 1):
+        """
+        :param stage: "verification", "stimulus" or "recovery"
+        :param factor: multiplier of SOLVE_BUDGETS (used in slow lane)
+        """
+        para = SOLVE_BUDGETS[stage]
+        self.stage = stage
+        self.max_evaluations = para["evaluations"] * factor
+        self.max_time = para["wall_time"] * factor
+        self.evaluations = 0
+        self.start = time.time()
+
+    def wrap(self, equations):
+        def budgeted(*args):
+            self.evaluations += 1
+            if self.evaluations > self.max_evaluations:
+                raise BudgetExceeded(self.stage, "evaluations")
+            # Clock is checked only occasionally to keep overhead small
+            if self.evaluations % 100 == 0 and (
+                    time.time() - self.start > self.max_time):
+                raise BudgetExceeded(self.stage, "wall_time")
+            return equations(*args)
+
+        return budgeted
+
+
+def integrate(system: str, initial, time_points, enzymes: dict, feed_para,
+              para: dict, budget: SolveBudget = None):
+    """
+    odeint with solver settings para. With budget, equations are wrapped
+    by it and failure of odeint (e.g. excess work) raises BudgetExceeded
+    instead of returning unreliable output.
+    """
+    if budget is None:
+        return odeint(get_equations(system), initial, time_points,
+                      args=(enzymes, feed_para), rtol=para["rtol"],
+                      atol=para["atol"], mxstep=para["mxstep"])
+    with warnings.catch_warnings():
+        # Failure is reported with BudgetExceeded
+        warnings.simplefilter("ignore")
+        output, info = odeint(budget.wrap(get_equations(system)), initial,
+                              time_points, args=(enzymes, feed_para),
+                              rtol=para["rtol"], atol=para["atol"],
+                              mxstep=para["mxstep"], full_output=True)
+    if info["message"] != "Integration successful.":
+        raise BudgetExceeded(budget.stage, "excess_work" if "Excess work"
+                             in info["message"] else "solver_failure")
+    return output
+
+
+def solve_stage(system: str, initial, end_time: float, enzymes: dict,
+                feed_para, stage: str, profile: str = None,
+                budget: SolveBudget = None):
+    """
+    Integrates system from 0 to end_time with solver settings of stage
+    :param budget: optional budget of integration
+    :return: output of odeint
+    """
+    para = get_profile(stage, profile)
+    time_points = np.linspace(0, end_time, para["points"])
+    return integrate(system, initial, time_points, enzymes, feed_para, para,
+                     budget)
+
+
+def get_recovery_time(profile: str = None):
+    """
+    Output time points of recovery for given accuracy profile
+    """
+    points = get_profile("recovery", profile)["points"]
+    if points == len(recovery_time):
+        return recovery_time
+    return np.linspace(0, recovery_time[-1], points)
+
+
+def get_flux_balance(enzymes: dict, system: str):
+    """
+    Steady state without feedback from flux balance
+    :return: steady state or None if FLUX_BALANCE_STEADY_STATE is False or
+    system has no closed form
+    """
+    if not FLUX_BALANCE_STEADY_STATE:
+        return None
+    return get_flux_balance_ss(system, enzymes)
 
 
 def get_scaled_enzymes(filename: str, system: str) -> dict:
     with open(filename) as f:
         enzymes = convert_to_enzyme(extract_enz_from_log(f.read()))
-    init_con = get_random_concentrations(200, system)
-    initial_time = np.linspace(0, 2000, 5000)
-    ss = odeint(get_equations(system), init_con, initial_time,
-                args=(enzymes, None))[-1]
+    ss = get_flux_balance(enzymes, system)
+    if ss is None:
+        init_con = get_random_concentrations(200, system)
+        initial_time = np.linspace(0, 2000, 5000)
+        ss = odeint(get_equations(system), init_con, initial_time,
+                    args=(enzymes, None))[-1]
     plc_base = enzymes[E_PLC].v
     for e in enzymes:
         if e != E_SOURCE:
@@ -34,40 +154,53 @@ def get_scaled_enzymes(filename: str, system: str) -> dict:
     return enzymes
 
 
-def save_data(enzymes, feed_para, recovery_array, ss_lipids):
+def get_timings(lipid_array, ss_value, time_points=None) -> list:
+    """
+    Time at which lipid crosses each of the RECOVERY_POINTS
+    :param lipid_array: recovery profile of single lipid
+    :param ss_value: steady state value of same lipid
+    :param time_points: time points of recovery profile (default is
+    get_recovery_time() of current accuracy profile)
+    :return: list of timings (NOT_RECOVERED if point is never crossed)
+    """
+    if time_points is None:
+        time_points = get_recovery_time()
+    timings = []
+    for point in RECOVERY_POINTS:
+        req_con = get_threshold(ss_value, point)
+        crossed = np.flatnonzero(np.asarray(lipid_array) > req_con)
+        if len(crossed) == 0:
+            timings.append(NOT_RECOVERED)
+        elif crossed[0] == 0:
+            timings.append(time_points[1])
+        else:
+            timings.append(time_points[crossed[0]])
+    return timings
+
+
+def get_recovery_data(enzymes, feed_para, recovery_array, ss_lipids,
+                      time_points=None) -> dict:
+    """
+    Summarizes recovery profile into the record stored in output file
+    :param enzymes: enzymes (without feedback correction)
+    :param feed_para: feedback parameters
+    :param recovery_array: output of recovery integration
+    :param ss_lipids: steady state before stimulus
+    :param time_points: time points of recovery integration (default is
+    get_recovery_time() of current accuracy profile)
+    :return: dictionary of output record
+    """
     ar_pip2 = np.asarray(recovery_array[:, I_PIP2])
     ar_pi4p = np.asarray(recovery_array[:, I_PI4P])
 
-    pip2_timings = []
-    pi4p_timings = []
+    pip2_timings = get_timings(ar_pip2, ss_lipids[I_PIP2], time_points)
+    pi4p_timings = get_timings(ar_pi4p, ss_lipids[I_PI4P], time_points)
     pi4p_depletion = min(recovery_array[:, I_PI4P])
 
-    for point in RECOVERY_POINTS:
-        req_con = ss_lipids[I_PIP2] * point / 100
-        try:
-            i = recovery_time[[x > req_con for x in ar_pip2].index(True)]
-            if i == 0.0:
-                pip2_timings.append(recovery_time[1])
-            else:
-                pip2_timings.append(i)
-        except ValueError:
-            pip2_timings.append(-1989)
-
-    for point in RECOVERY_POINTS:
-        req_con = ss_lipids[I_PI4P] * point / 100
-        try:
-            i = recovery_time[[x > req_con for x in ar_pi4p].index(True)]
-            if i == 0.0:
-                pi4p_timings.append(recovery_time[1])
-            else:
-                pi4p_timings.append(i)
-        except ValueError:
-            pi4p_timings.append(-1989)
-
     pip2_diff = recovery_array[-1][I_PIP2] / ss_lipids[I_PIP2]
     pi4p_diff = recovery_array[-1][I_PI4P] / ss_lipids[I_PI4P]
 
-    data = {
+    return {
         "Enzymes": {e: enzymes[e].properties for e in enzymes},
         "fed_para": feed_para,
         "pip2_timings": pip2_timings,
@@ -76,12 +209,267 @@ def save_data(enzymes, feed_para, recovery_array, ss_lipids):
         "ss_dif_pip2": pip2_diff,
         "ss_dif_pi4p": pi4p_diff
     }
-    OUTPUT.info(json.dumps(data, sort_keys=True))
 
 
-def scan_single_feedback(filename: str, system: str):
-    # Log the analysis details
-    log_data = {
+def make_feed_para(hill, carry, multi, fed_type, sub_ind, enz) -> dict:
+    """
+    Creates feedback parameter dictionary for single feedback
+    """
+    return {
+        enz: {
+            F_HILL_COEFFICIENT: hill,
+            F_FEED_SUBSTRATE_INDEX: sub_ind,
+            F_TYPE_OF_FEEDBACK: fed_type,
+            F_CARRYING_CAPACITY: carry,
+            F_MULTIPLICATION_FACTOR: multi,
+        }
+    }
+
+
+def get_correction_factor(no_feed_ss, hill, carry, multi, fed_type,
+                          sub_ind) -> float:
+    """
+    Correction in enzyme Vmax for feedback.
+    This ensures same steady state with feedback
+    """
+    reg = 1 + pow((no_feed_ss[sub_ind] / carry), hill)
+    fed = 1 + multi * pow((no_feed_ss[sub_ind] / carry), hill)
+    fed_factor = 1
+
+    # Following multiplication should be opposite to feedback.
+    if fed_type == FEEDBACK_NEGATIVE:
+        fed_factor = fed / reg
+    elif fed_type == FEEDBACK_POSITIVE:
+        fed_factor = reg / fed
+    return fed_factor
+
+
+def is_degenerate(hill, carry, multi, fed_type, sub_ind, enz) -> bool:
+    """
+    Checks if feedback point is exactly same as no feedback.
+    With multiplication factor 1, fed == reg and hence feedback factor and
+    Vmax correction are exactly 1 for both types of feedback.
+    """
+    return multi == 1
+
+
+def is_same_steady_state(no_feed_ss, state) -> bool:
+    """
+    Rough check used by the scan to reject points at which system reaches
+    other steady state than without feedback
+    """
+    return bool(round(sum(no_feed_ss / np.asarray(state))) == 8)
+
+
+def get_threshold(ss_value, point) -> float:
+    """
+    Concentration at which lipid is counted as recovered to given point
+    (lowered by RECOVERY_THRESHOLD_TOLERANCE)
+    """
+    return ss_value * point / 100 * (1 - RECOVERY_THRESHOLD_TOLERANCE)
+
+
+def integrate_recovery(system: str, stim, enzymes: dict, feed_para,
+                       profile: str = None, budget: SolveBudget = None):
+    """
+    Integrates recovery after stimulus on get_recovery_time(profile).
+    Recovery is always integrated till the end: LSODA takes large steps
+    once lipids are settled, hence stopping at the earliest settled time
+    point would save only ~10% of function evaluations on open2.
+    :param profile: name of accuracy profile
+    :param budget: optional budget of integration
+    :return: recovery array
+    """
+    return integrate(system, stim, get_recovery_time(profile), enzymes,
+                     feed_para, get_profile("recovery", profile), budget)
+
+
+def stimulate(system: str, ss_lipids, enzymes: dict, feed_para,
+              exact_stimulus: bool = None, profile: str = None,
+              budget: SolveBudget = None):
+    """
+    Gives stimulus to system at steady state
+    :param exact_stimulus: if True, PLC is stimulated (exact), otherwise
+    PIP2 is moved to DAG (approximate). Default is EXACT_STIMULUS
+    :param budget: optional budget of exact stimulus
+    :return: lipid concentrations after stimulus or None if exact stimulus
+    could not reach PERCENTAGE_DEPLETION
+    """
+    if exact_stimulus is None:
+        exact_stimulus = EXACT_STIMULUS
+    if not exact_stimulus:
+        return give_stimulus(ss_lipids, PERCENTAGE_DEPLETION)
+    para = get_profile("recovery", profile)
+    equations = None
+    if budget is not None:
+        equations = budget.wrap(get_equations(system))
+    stim, _ = give_plc_stimulus(system, ss_lipids, enzymes, feed_para,
+                                PERCENTAGE_DEPLETION, PLC_STIMULATION_FACTOR,
+                                STIMULATION_MAX_TIME, para["rtol"],
+                                para["atol"], equations)
+    return stim
+
+
+def get_no_feedback_recovery(system: str, enzymes: dict, no_feed_ss,
+                             exact_stimulus: bool = None,
+                             profile: str = None):
+    """
+    Recovery after stimulus without any feedback
+    :return: recovery array
+    """
+    stim = stimulate(system, no_feed_ss, enzymes, None, exact_stimulus,
+                     profile)
+    if stim is None:
+        raise Exception("PLC stimulation can not deplete PIP2 by %s %% "
+                        "without feedback" % PERCENTAGE_DEPLETION)
+    return integrate_recovery(system, stim, enzymes, None, profile)
+
+
+def get_budget_record(enzymes, feed_para, error: BudgetExceeded,
+                      budget_factor: float) -> dict:
+    """
+    Output record of point whose integration exceeded its budget
+    """
+    return {
+        "Enzymes": {e: enzymes[e].properties for e in enzymes},
+        "fed_para": feed_para,
+        "outcome": OUTCOME_BUDGET_EXCEEDED,
+        "stage": error.stage,
+        "reason": error.reason,
+        "budget_factor": budget_factor
+    }
+
+
+def solve_feedback_point(system: str, enzymes: dict, init_con, no_feed_ss,
+                         hill, carry, multi, fed_type, sub_ind, enz,
+                         no_feed_recovery=None, archive=None,
+                         exact_stimulus: bool = None, profile: str = None,
+                         budget_factor: float = 1):
+    """
+    Runs single point of feedback scan
+    :param system: topology or known model
+    :param enzymes: scaled enzymes (without feedback)
+    :param init_con: initial condition used for steady state
+    :param no_feed_ss: steady state without feedback
+    :param no_feed_recovery: cached recovery without feedback. If given,
+    degenerate points are not integrated again.
+    :param archive: if given, recovery trajectory is stored in this
+    TrajectoryArchive
+    :param exact_stimulus: type of stimulus (default is EXACT_STIMULUS)
+    :param profile: name of accuracy profile (default is ACCURACY_PROFILE).
+    no_feed_recovery should be calculated with same profile.
+    :param budget_factor: multiplier of SOLVE_BUDGETS (None for no budget)
+    :return: output record or None if steady state with feedback is not
+    same as without feedback (or exact stimulus could not deplete PIP2).
+    If budget is exceeded, record has only outcome (see is_budget_record).
+    """
+    feed_para = make_feed_para(hill, carry, multi, fed_type, sub_ind, enz)
+    if no_feed_recovery is not None and is_degenerate(
+            hill, carry, multi, fed_type, sub_ind, enz):
+        # Same value which would be left by the last ODE evaluation
+        feed_para[enz][F_FEEDBACK_SUBSTRATE] = no_feed_recovery[-1][sub_ind]
+        if archive is not None:
+            archive.add((hill, carry, multi, fed_type, sub_ind, enz),
+                        no_feed_recovery, no_feed_ss,
+                        get_recovery_time(profile))
+        return get_recovery_data(enzymes, feed_para, no_feed_recovery,
+                                 no_feed_ss, get_recovery_time(profile))
+    fed_factor = get_correction_factor(no_feed_ss, hill, carry, multi,
+                                       fed_type, sub_ind)
+
+    def budget(stage):
+        if budget_factor is None:
+            return None
+        return SolveBudget(stage, budget_factor)
+
+    error = None
+    enzymes[enz].v *= fed_factor
+    try:
+        init_ss = solve_stage(system, init_con, init_time[-1], enzymes,
+                              feed_para, "verification", profile,
+                              budget("verification"))[-1]
+
+        # Roughly check if steady state values are same as without feedback
+        if not is_same_steady_state(no_feed_ss, init_ss):
+            return None
+
+        # Give stimulus
+        stim = stimulate(system, init_ss, enzymes, feed_para, exact_stimulus,
+                         profile, budget("stimulus"))
+        if stim is None:
+            LOG.info("PIP2 depletion not reached for %s" % json.dumps(
+                feed_para, sort_keys=True))
+            return None
+        recovery = integrate_recovery(system, stim, enzymes, feed_para,
+                                      profile, budget("recovery"))
+    except BudgetExceeded as e:
+        error = e
+    finally:
+        # Change enzyme values back to original
+        enzymes[enz].v /= fed_factor
+    if error is not None:
+        LOG.info("%s for %s" % (error, json.dumps(feed_para, sort_keys=True)))
+        return get_budget_record(enzymes, feed_para, error, budget_factor)
+    if archive is not None:
+        archive.add((hill, carry, multi, fed_type, sub_ind, enz), recovery,
+                    init_ss, get_recovery_time(profile))
+    return get_recovery_data(enzymes, feed_para, recovery, init_ss,
+                             get_recovery_time(profile))
+
+
+def get_no_feedback_ss(enzymes: dict, system: str, profile: str = None,
+                       validate: bool = False):
+    """
+    Steady state without any feedback. Flux balance is used when it is
+    available, otherwise system is integrated from random initial condition.
+    :param validate: if True, flux balance steady state is compared with
+    integrated one and exception is raised if they differ by more than
+    FLUX_BALANCE_TOLERANCE
+    :return: initial condition (used as starting point of feedback
+    verification) and steady state
+    """
+    init_con = get_random_concentrations(1, system)
+    no_feed_ss = get_flux_balance(enzymes, system)
+    if no_feed_ss is None or validate:
+        integrated = solve_stage(system, init_con, init_time[-1], enzymes,
+                                 None, "steady_state", profile)[-1]
+        if no_feed_ss is None:
+            return init_con, integrated
+        difference = max(abs(integrated / no_feed_ss - 1))
+        if difference > FLUX_BALANCE_TOLERANCE:
+            raise Exception("Flux balance steady state differs from "
+                            "integrated steady state by %s" % difference)
+    return init_con, no_feed_ss
+
+
+def get_scan_ranges() -> list:
+    """
+    Ranges of single feedback scan in order of
+    (hill, carry, multi, fed_type, sub_ind, enz). Duplicate values are
+    removed by scan plan.
+    """
+    return [RANGE_HILL_COEFFICIENT, RANGE_CARRY, RANGE_MULTIPLICATION_FACTOR,
+            RANGE_FEED_TYPE, RANGE_SUBSTRATE, RANGE_ENZYMES]
+
+
+def get_scan_plan() -> ScanPlan:
+    """
+    Scan plan of single feedback scan (from ranges in analysis settings)
+    """
+    names = [F_HILL_COEFFICIENT, F_CARRYING_CAPACITY,
+             F_MULTIPLICATION_FACTOR, F_TYPE_OF_FEEDBACK,
+             F_FEED_SUBSTRATE_INDEX, F_ENZYME]
+    return ScanPlan(list(zip(names, get_scan_ranges())))
+
+
+def get_scan_settings(system: str, plan: ScanPlan) -> dict:
+    """
+    Analysis details of feedback scan (logged at the start of scan). Every
+    setting which changes scan output should be here.
+    :param system: topology or known model
+    :param plan: scan plan or its shard
+    """
+    return {
         "UID": CURRENT_JOB,
         "system": system,
         "Analysis": "Feedback Scan with Scaling",
@@ -89,60 +477,149 @@ def scan_single_feedback(filename: str, system: str):
         "number_of_feedback": 1,
         "recovery_points": RECOVERY_POINTS,
         "depletion_percentage": PERCENTAGE_DEPLETION,
+        "recovery_threshold_tolerance": RECOVERY_THRESHOLD_TOLERANCE,
+        "exact_stimulus": EXACT_STIMULUS,
+        "plc_stimulation_factor": PLC_STIMULATION_FACTOR,
+        "stimulation_max_time": STIMULATION_MAX_TIME,
+        "accuracy_profile": ACCURACY_PROFILE,
+        "solver_settings": ACCURACY_PROFILES[ACCURACY_PROFILE],
+        "flux_balance_steady_state": FLUX_BALANCE_STEADY_STATE,
+        "solve_budgets": SOLVE_BUDGETS,
+        "slow_lane_budget_factor": SLOW_LANE_BUDGET_FACTOR,
+        "plan": plan.to_dict(),
         "version": "3.0"}
-    LOG.info(json.dumps(log_data, sort_keys=True))
 
-    total_size = len(list(product(
-        *[RANGE_HILL_COEFFICIENT, RANGE_CARRY, RANGE_MULTIPLICATION_FACTOR,
-          RANGE_FEED_TYPE, RANGE_SUBSTRATE, RANGE_ENZYMES])))
+
+def scan_single_feedback(filename: str, system: str, archive=None,
+                         plan: ScanPlan = None):
+    """
+    Scans all single feedback points
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param archive: optional TrajectoryArchive to store recovery curves
+    :param plan: scan plan or its shard (default is get_scan_plan())
+    """
+    if plan is None:
+        plan = get_scan_plan()
+    # Log the analysis details
+    LOG.info(json.dumps(get_scan_settings(system, plan), sort_keys=True))
+
+    total_size = len(plan)
+    degenerate = 0
     progress_counter = 0
     enzymes = get_scaled_enzymes(filename, system)
-    init_con = get_random_concentrations(1, system)
-    init_time = np.linspace(0, 10000, 10000)
-
-    no_feed_ss = odeint(get_equations(system), init_con, init_time,
-                        args=(enzymes, None))[-1]
+    init_con, no_feed_ss = get_no_feedback_ss(enzymes, system, validate=True)
+    no_feed_recovery = get_no_feedback_recovery(system, enzymes, no_feed_ss)
+    slow_lane = []
 
-    for hill, carry, multi, fed_type, sub_ind, enz in product(
-            *[RANGE_HILL_COEFFICIENT, RANGE_CARRY, RANGE_MULTIPLICATION_FACTOR,
-              RANGE_FEED_TYPE, RANGE_SUBSTRATE, RANGE_ENZYMES]):
+    for point in plan:
         update_progress(progress_counter / total_size)
         progress_counter += 1
-        feed_para = {
-            enz: {
-                F_HILL_COEFFICIENT: hill,
-                F_FEED_SUBSTRATE_INDEX: sub_ind,
-                F_TYPE_OF_FEEDBACK: fed_type,
-                F_CARRYING_CAPACITY: carry,
-                F_MULTIPLICATION_FACTOR: multi,
-            }
-        }
+        if is_degenerate(*point):
+            degenerate += 1
+        data = solve_feedback_point(system, enzymes, init_con, no_feed_ss,
+                                    *point, no_feed_recovery=no_feed_recovery,
+                                    archive=archive)
+        if data is not None:
+            OUTPUT.info(json.dumps(data, sort_keys=True))
+            if is_budget_record(data):
+                slow_lane.append(point)
 
-        # Correct enzyme Vmax for feedback
-        # This ensures same steady state with feedback
-        reg = 1 + pow((no_feed_ss[sub_ind] / carry), hill)
-        fed = 1 + multi * pow((no_feed_ss[sub_ind] / carry), hill)
-        fed_factor = 1
+    # Points which exceeded their budget are retried with larger budget
+    # only after the main scan so that they do not slow it down
+    solved = 0
+    for point in slow_lane:
+        data = solve_feedback_point(system, enzymes, init_con, no_feed_ss,
+                                    *point, no_feed_recovery=no_feed_recovery,
+                                    archive=archive,
+                                    budget_factor=SLOW_LANE_BUDGET_FACTOR)
+        if data is not None:
+            OUTPUT.info(json.dumps(data, sort_keys=True))
+            solved += not is_budget_record(data)
+    if len(slow_lane) > 0:
+        LOG.info("%d points exceeded solve budget, %d of them solved in "
+                 "slow lane" % (len(slow_lane), solved))
 
-        # Following multiplication should be opposite to feedback.
-        if fed_type == FEEDBACK_NEGATIVE:
-            fed_factor = fed / reg
-        elif fed_type == FEEDBACK_POSITIVE:
-            fed_factor = reg / fed
+    if archive is not None:
+        archive.flush()
 
-        enzymes[enz].v *= fed_factor
-        init_ss = odeint(get_equations(system), init_con, init_time,
-                         args=(enzymes, feed_para))[-1]
+    LOG.info("Solves avoided : %d degenerate points (no feedback result "
+             "reused) and %d duplicate points" % (degenerate,
+                                                  plan.duplicates))
 
-        # Roughly check if steady state values are same as without feedback
-        if round(sum(no_feed_ss / init_ss)) == 8:
-            # Give stimulus
-            stim = give_stimulus(init_ss, PERCENTAGE_DEPLETION)
-            recovery = odeint(get_equations(system), stim, recovery_time,
-                              args=(enzymes, feed_para))
-            # Change enzyme values back to original
-            enzymes[enz].v /= fed_factor
-            save_data(enzymes, feed_para, recovery, init_ss)
-        else:
-            # Change enzyme values back to original
-            enzymes[enz].v /= fed_factor
+
+def estimate_scan_runtime(filename: str, system: str,
+                          plan: ScanPlan = None, samples: int = 20,
+                          seed: int = 0) -> float:
+    """
+    Estimates runtime of scan from short calibration run and logs it
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param plan: scan plan or its shard (default is get_scan_plan())
+    :param samples: number of calibration points
+    :param seed: seed of random sample
+    :return: estimated time in seconds (without no feedback baseline)
+    """
+    if plan is None:
+        plan = get_scan_plan()
+    enzymes = get_scaled_enzymes(filename, system)
+    init_con, no_feed_ss = get_no_feedback_ss(enzymes, system)
+    no_feed_recovery = get_no_feedback_recovery(system, enzymes, no_feed_ss)
+
+    def solve(*point):
+        solve_feedback_point(system, enzymes, init_con, no_feed_ss, *point,
+                             no_feed_recovery=no_feed_recovery)
+
+    estimate = plan.estimate_runtime(solve, samples, seed)
+    LOG.info("Estimated runtime of %d points : %.1f hours" % (
+        len(plan), estimate / 3600))
+    return estimate
+
+
+def compare_stimulus_cost(filename: str, system: str, samples: int = 100,
+                          seed: int = 0) -> dict:
+    """
+    Compares cost of exact (PLC) and approximate stimulus on random sample
+    of scan points and logs the report
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param samples: number of grid points
+    :param seed: seed of random sample
+    :return: report dictionary
+    """
+    enzymes = get_scaled_enzymes(filename, system)
+    init_con, no_feed_ss = get_no_feedback_ss(enzymes, system)
+    points = get_scan_plan().sample(samples, seed)
+    report = {}
+    results = {}
+    for exact in [False, True]:
+        start = time.time()
+        results[exact] = [solve_feedback_point(system, enzymes, init_con,
+                                               no_feed_ss, *p,
+                                               exact_stimulus=exact,
+                                               budget_factor=None)
+                          for p in points]
+        report["exact" if exact else "approximate"] = {
+            "time_per_point": (time.time() - start) / samples,
+            "accepted": sum(x is not None for x in results[exact])}
+
+    # Cost of stimulus phase alone
+    start = time.time()
+    _, evaluations = give_plc_stimulus(system, no_feed_ss, enzymes, None,
+                                       PERCENTAGE_DEPLETION,
+                                       PLC_STIMULATION_FACTOR,
+                                       STIMULATION_MAX_TIME)
+    report["exact_stimulus_phase"] = {"time": time.time() - start,
+                                      "function_evaluations": evaluations}
+    report["relative_cost"] = report["exact"]["time_per_point"] / report[
+        "approximate"]["time_per_point"]
+
+    # Difference in 90% PIP2 recovery timings
+    index = RECOVERY_POINTS.index(90)
+    diff = [abs(a["pip2_timings"][index] - b["pip2_timings"][index]) for
+            a, b in zip(results[False], results[True]) if
+            a is not None and b is not None]
+    if len(diff) > 0:
+        report["mean_pip2_timing_difference"] = float(np.mean(diff))
+    LOG.info(json.dumps(report, sort_keys=True))
+    return report
@@ -7,7 +7,8 @@ import matplotlib.gridspec as gridspec
 import matplotlib.pylab as plt
 
 from analysis.analysis_settings import *
-from analysis.feedback_scaling import recovery_time
+from analysis.feedback_scaling import get_no_feedback_ss, \
+    get_no_feedback_recovery, get_recovery_time, get_timings
 from analysis.helper import *
 
 DIFF_INDEX = 4
@@ -44,52 +45,121 @@ class VisualizeSingle:
             self.feedback_substrate_index)
 
 
-def get_without_feed_para(enz, system) -> list:
-    init_con = get_random_concentrations(1, system)
-    init_time = np.linspace(0, 10000, 10000)
-    no_feed_ss = odeint(get_equations(system), init_con, init_time,
-                        args=(enz, None))[-1]
-    stim = give_stimulus(no_feed_ss, PERCENTAGE_DEPLETION)
-    recovery = odeint(get_equations(system), stim, recovery_time,
-                      args=(enz, None))
-    ar_pip2 = np.asarray(recovery[:, I_PIP2])
-    pip2_timings = []
-    for point in RECOVERY_POINTS:
-        req_con = no_feed_ss[I_PIP2] * point / 100
-        try:
-            i = recovery_time[[x > req_con for x in ar_pip2].index(True)]
-            if i == 0.0:
-                pip2_timings.append(recovery_time[1])
-            else:
-                pip2_timings.append(i)
-        except ValueError:
-            pip2_timings.append(-1989)
-
-    return pip2_timings
-
-
-def get_parameters(filename: str, system: str) -> list:
+def get_baseline_settings(settings: dict = None) -> tuple:
+    """
+    Stimulus and accuracy profile with which run calculated its recovery.
+    Runs logged before these settings existed used approximate stimulus
+    and "standard" profile.
+    :param settings: analysis details of run (logged at start of scan, see
+    get_run_settings). If None, current analysis settings are used.
+    :return: (exact_stimulus, profile)
+    """
+    if settings is None:
+        return EXACT_STIMULUS, ACCURACY_PROFILE
+    exact_stimulus = settings.get("exact_stimulus", False)
+    profile = settings.get("accuracy_profile", "standard")
+    if profile not in ACCURACY_PROFILES:
+        raise Exception("Unknown accuracy profile %s of job %s" % (
+            profile, settings["UID"]))
+    # Other settings of recovery are read from analysis settings and hence
+    # should be same as in run
+    current = {"recovery_points": RECOVERY_POINTS,
+               "depletion_percentage": PERCENTAGE_DEPLETION,
+               "recovery_threshold_tolerance": RECOVERY_THRESHOLD_TOLERANCE,
+               "solver_settings": ACCURACY_PROFILES[profile],
+               "flux_balance_steady_state": FLUX_BALANCE_STEADY_STATE}
+    if exact_stimulus:
+        current["plc_stimulation_factor"] = PLC_STIMULATION_FACTOR
+        current["stimulation_max_time"] = STIMULATION_MAX_TIME
+    current = json.loads(json.dumps(current))
+    different = sorted(k for k in current if k in settings and
+                       settings[k] != current[k])
+    if len(different) > 0:
+        raise Exception("Recovery without feedback of job %s can not be "
+                        "calculated with current settings : %s" % (
+                            settings["UID"], ", ".join(different)))
+    return exact_stimulus, profile
+
+
+def get_without_feed_baseline(enz, system, settings: dict = None) -> tuple:
+    """
+    Recovery without feedback
+    :param enz: scaled enzymes
+    :param system: topology or known model
+    :param settings: analysis details of run whose records are compared
+    with this baseline (see get_baseline_settings)
+    :return: (PIP2 recovery timings, steady state)
+    """
+    exact_stimulus, profile = get_baseline_settings(settings)
+    _, no_feed_ss = get_no_feedback_ss(enz, system, profile)
+    recovery = get_no_feedback_recovery(system, enz, no_feed_ss,
+                                        exact_stimulus, profile)
+    return get_timings(recovery[:, I_PIP2], no_feed_ss[I_PIP2],
+                       get_recovery_time(profile)), no_feed_ss
+
+
+def get_without_feed_para(enz, system, settings: dict = None) -> list:
+    """
+    PIP2 recovery timings without feedback (see get_without_feed_baseline)
+    """
+    return get_without_feed_baseline(enz, system, settings)[0]
+
+
+def get_output_settings(filename: str, script_log: str = None):
+    """
+    Analysis details of run which wrote first record of output file
+    :param filename: output file
+    :param script_log: script log of run (None to use current settings)
+    :return: dictionary of settings (None without script log)
+    """
+    if script_log is None:
+        return None
+    with open(filename) as f:
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            uid, record = extract_record_from_log(line)
+            if is_budget_record(record):
+                continue
+            settings = get_run_settings(script_log, uid)
+            if settings is None:
+                raise Exception("Settings of job %s not found in %s" % (
+                    uid, script_log))
+            return settings
+    return None
+
+
+def get_parameters(filename: str, system: str,
+                   script_log: str = None) -> list:
+    """
+    Parses output file
+    :param filename: output file
+    :param system: topology or known model
+    :param script_log: script log of run. Recovery without feedback is
+    calculated with settings of run (current settings if None).
+    """
     para = []
     without_feed = None
     with open(filename) as f:
         for line in f:
+            if is_budget_record(extract_record_from_log(line)[1]):
+                continue
             if without_feed is None:
                 enz = convert_to_enzyme(extract_enz_from_log(line))
-                without_feed = get_without_feed_para(enz, system)
+                without_feed = get_without_feed_para(
+                    enz, system, get_output_settings(filename, script_log))
             para.append(VisualizeSingle(line.strip(), without_feed))
 
     return para
 
 
-def general_core(output_file: str, system: str) -> None:
+def draw_general_core(all_data: list, index: int = DIFF_INDEX) -> None:
     """
-    Plots histogram for Positive and Negative feedback
+    Draws histogram for Positive and Negative feedback
     """
-    all_data = get_parameters(output_file, system)
-
-    diff_positive = [x.diff[DIFF_INDEX] for x in all_data if
+    diff_positive = [x.diff[index] for x in all_data if
                      x.type_of_feedback == FEEDBACK_POSITIVE]
-    diff_negative = [x.diff[DIFF_INDEX] for x in all_data if
+    diff_negative = [x.diff[index] for x in all_data if
                      x.type_of_feedback == FEEDBACK_NEGATIVE]
     plt.hist(diff_positive, 10, alpha=0.5, label="Positive interaction",
              color="b")
@@ -97,19 +167,16 @@ def general_core(output_file: str, system: str) -> None:
              color="r")
     plt.axvline(1, linestyle="--", color="k")
     plt.yscale("log")
-    plt.xlabel("90% PIP$_2$ recovery (Without Feedback/With Feedback)")
+    plt.xlabel("%s%% PIP$_2$ recovery (Without Feedback/With Feedback)" %
+               RECOVERY_POINTS[index])
     plt.ylabel("Frequency (Log Scale)")
     plt.legend(loc=0)
-    plt.savefig("general.png", format='png', dpi=300, bbox_inches='tight')
-    plt.show()
 
 
-def depletion_plot(output_file: str, system: str) -> None:
+def draw_depletion(all_data: list) -> None:
     """
-    Plots histogram for Positive and Negative feedback
+    Draws histogram of PI4P depletion
     """
-    all_data = get_parameters(output_file, system)
-
     diff_positive = [x.normalized_pi4p_depletion for x in all_data if
                      x.type_of_feedback == FEEDBACK_POSITIVE]
     diff_negative = [x.normalized_pi4p_depletion for x in all_data if
@@ -123,20 +190,16 @@ def depletion_plot(output_file: str, system: str) -> None:
     plt.xlabel("Depletion of PI4P with respect to its steady state")
     plt.ylabel("Frequency (Log Scale)")
     plt.legend(loc=0)
-    plt.savefig("pi4p_depletion.png", format='png', dpi=300,
-                bbox_inches='tight')
-    plt.show()
 
 
-def pi4p_pip2_timing(output_file, system) -> None:
+def draw_pi4p_pip2_timing(all_data: list, index: int = DIFF_INDEX) -> None:
     """
-    Plots histogram of PI4P depletion
+    Draws histogram of PI4P to PIP2 recovery timings
     """
-    all_data = get_parameters(output_file, system)
-    diff_positive = [x.pi4p_timings[DIFF_INDEX] / x.pip2_timings[DIFF_INDEX]
+    diff_positive = [x.pi4p_timings[index] / x.pip2_timings[index]
                      for x in all_data if
                      x.type_of_feedback == FEEDBACK_POSITIVE]
-    diff_negative = [x.pi4p_timings[DIFF_INDEX] / x.pip2_timings[DIFF_INDEX]
+    diff_negative = [x.pi4p_timings[index] / x.pip2_timings[index]
                      for x in all_data if
                      x.type_of_feedback == FEEDBACK_NEGATIVE]
     plt.hist(diff_positive, 10, alpha=0.5, label="Positive Feedback",
@@ -145,19 +208,34 @@ def pi4p_pip2_timing(output_file, system) -> None:
              color="r")
     plt.yscale("log")
     plt.axvline(1, linestyle="--", color="k")
-    plt.xlabel("time to 90% recovery (PI4P/PIP$_2$)")
+    plt.xlabel("time to %s%% recovery (PI4P/PIP$_2$)" %
+               RECOVERY_POINTS[index])
     plt.ylabel("Frequency")
     plt.legend(loc=0)
-    plt.savefig("pi4p_pip2_timing.png", format='png', dpi=300,
-                bbox_inches='tight')
-    plt.show()
 
 
-def pi4p_to_pip2_all_depletion(output_file, system) -> None:
+def _draw_grid(grid_shape: tuple, positive: dict, negative: dict,
+               title: str = "%s") -> None:
+    gs = gridspec.GridSpec(*grid_shape)
+    grid_count = 0
+
+    for m in positive:
+        ax = plt.subplot(gs[grid_count])
+        ax.hist(positive[m], 10, alpha=0.5, color="b")
+        ax.hist(negative[m], 10, alpha=0.5, color="r")
+        ax.axvline(1, linestyle="--", color="k")
+        # ax.set_xticks([])
+        ax.set_yscale("log")
+        ax.set_yticks([])
+        ax.set_title(title % m)
+        # ax.set_xlim(0, 2)
+        grid_count += 1
+
+
+def draw_recovery_point_wise(all_data: list) -> None:
     """
-    Plots lipid wise feedback distribution
+    Draws PI4P to PIP2 recovery timings for every recovery point
     """
-    all_data = get_parameters(output_file, system)
     lipid_wise_pos = defaultdict(list)
     lipid_wise_neg = defaultdict(list)
     for p in all_data:
@@ -170,94 +248,99 @@ def pi4p_to_pip2_all_depletion(output_file, system) -> None:
                 else:
                     lipid_wise_neg[str(m)].append(b)
 
-    gs = gridspec.GridSpec(3, 2)
-    grid_count = 0
+    _draw_grid((3, 2), lipid_wise_pos, lipid_wise_neg,
+               "%s %% of Steady State")
 
-    for m in lipid_wise_pos:
-        ax = plt.subplot(gs[grid_count])
-        ax.hist(lipid_wise_pos[m], 10, alpha=0.5, color="b")
-        ax.hist(lipid_wise_neg[m], 10, alpha=0.5, color="r")
-        ax.axvline(1, linestyle="--", color="k")
-        # ax.set_xticks([])
-        ax.set_yscale("log")
-        ax.set_yticks([])
-        ax.set_title("%s %% of Steady State" % m)
-        # ax.set_xlim(0, 2)
-        grid_count += 1
 
-    plt.savefig("lipid_wise.png", format='png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def check_lipid_wise(output_file, system) -> None:
+def draw_lipid_wise(all_data: list, index: int = DIFF_INDEX) -> None:
     """
-    Plots lipid wise feedback distribution
+    Draws lipid wise feedback distribution
     """
-    all_data = get_parameters(output_file, system)
     lipid_wise_pos = defaultdict(list)
     lipid_wise_neg = defaultdict(list)
     for p in all_data:
         if p.type_of_feedback == FEEDBACK_POSITIVE:
-            lipid_wise_pos[p.feedback_substrate_name].append(
-                p.diff[DIFF_INDEX])
+            lipid_wise_pos[p.feedback_substrate_name].append(p.diff[index])
         else:
-            lipid_wise_neg[p.feedback_substrate_name].append(p.diff[
-                                                                 DIFF_INDEX])
+            lipid_wise_neg[p.feedback_substrate_name].append(p.diff[index])
 
-    gs = gridspec.GridSpec(3, 3)
-    grid_count = 0
+    _draw_grid((3, 3), lipid_wise_pos, lipid_wise_neg)
 
-    for m in lipid_wise_pos:
-        ax = plt.subplot(gs[grid_count])
-        ax.hist(lipid_wise_pos[m], 10, alpha=0.5, color="b")
-        ax.hist(lipid_wise_neg[m], 10, alpha=0.5, color="r")
-        ax.axvline(1, linestyle="--", color="k")
-        # ax.set_xticks([])
-        ax.set_yscale("log")
-        ax.set_yticks([])
-        ax.set_title(m)
-        # ax.set_xlim(0, 2)
-        grid_count += 1
 
-    plt.savefig("lipid_wise.png", format='png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def check_enzyme_wise(output_file, system) -> None:
+def draw_enzyme_wise(all_data: list, index: int = DIFF_INDEX) -> None:
     """
-    Plots enzyme-wise feedback distribution
+    Draws enzyme-wise feedback distribution
     """
-
-    all_data = get_parameters(output_file, system)
     enzyme_wise_pos = defaultdict(list)
     enzyme_wise_neg = defaultdict(list)
     for p in all_data:
         if p.type_of_feedback == FEEDBACK_POSITIVE:
-            enzyme_wise_pos[p.feedback_enzyme].append(p.diff[DIFF_INDEX])
+            enzyme_wise_pos[p.feedback_enzyme].append(p.diff[index])
         else:
-            enzyme_wise_neg[p.feedback_enzyme].append(p.diff[DIFF_INDEX])
+            enzyme_wise_neg[p.feedback_enzyme].append(p.diff[index])
+
+    _draw_grid((4, 3), enzyme_wise_pos, enzyme_wise_neg)
 
-    gs = gridspec.GridSpec(4, 3)
-    grid_count = 0
-    for m in enzyme_wise_pos:
-        ax = plt.subplot(gs[grid_count])
-        ax.hist(enzyme_wise_pos[m], 10, alpha=0.5, color="b")
-        ax.hist(enzyme_wise_neg[m], 10, alpha=0.5, color="r")
-        ax.axvline(1, linestyle="--", color="k")
-        # ax.set_xticks([])
-        ax.set_yscale("log")
-        ax.set_yticks([])
-        ax.set_title(m)
-        grid_count += 1
 
-    plt.savefig("enzyme_wise.png", format='png', dpi=300, bbox_inches='tight')
+def _save_and_show(filename: str) -> None:
+    plt.savefig(filename, format='png', dpi=300, bbox_inches='tight')
     plt.show()
 
 
-def visualize(output_file: str, system: str):
-    # general_core(output_file, system)
-    # pi4p_pip2_timing(output_file, system)
-    # pi4p_to_pip2_all_depletion(output_file, system)
-    # depletion_plot(output_file, system)
-    # check_lipid_wise(output_file, system)
-    check_enzyme_wise(output_file, system)
+def general_core(output_file: str, system: str,
+                 script_log: str = None) -> None:
+    """
+    Plots histogram for Positive and Negative feedback
+    """
+    draw_general_core(get_parameters(output_file, system, script_log))
+    _save_and_show("general.png")
+
+
+def depletion_plot(output_file: str, system: str,
+                   script_log: str = None) -> None:
+    """
+    Plots histogram for Positive and Negative feedback
+    """
+    draw_depletion(get_parameters(output_file, system, script_log))
+    _save_and_show("pi4p_depletion.png")
+
+
+def pi4p_pip2_timing(output_file, system, script_log=None) -> None:
+    """
+    Plots histogram of PI4P depletion
+    """
+    draw_pi4p_pip2_timing(get_parameters(output_file, system, script_log))
+    _save_and_show("pi4p_pip2_timing.png")
+
+
+def pi4p_to_pip2_all_depletion(output_file, system, script_log=None) -> None:
+    """
+    Plots lipid wise feedback distribution
+    """
+    draw_recovery_point_wise(get_parameters(output_file, system, script_log))
+    _save_and_show("recovery_point_wise.png")
+
+
+def check_lipid_wise(output_file, system, script_log=None) -> None:
+    """
+    Plots lipid wise feedback distribution
+    """
+    draw_lipid_wise(get_parameters(output_file, system, script_log))
+    _save_and_show("lipid_wise.png")
+
+
+def check_enzyme_wise(output_file, system, script_log=None) -> None:
+    """
+    Plots enzyme-wise feedback distribution
+    """
+    draw_enzyme_wise(get_parameters(output_file, system, script_log))
+    _save_and_show("enzyme_wise.png")
+
+
+def visualize(output_file: str, system: str, script_log: str = None):
+    # general_core(output_file, system, script_log)
+    # pi4p_pip2_timing(output_file, system, script_log)
+    # pi4p_to_pip2_all_depletion(output_file, system, script_log)
+    # depletion_plot(output_file, system, script_log)
+    # check_lipid_wise(output_file, system, script_log)
+    check_enzyme_wise(output_file, system, script_log)
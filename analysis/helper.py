@@ -2,12 +2,15 @@
 Helper methods used in all analysis
 """
 import json
+import os
 
 import numpy as np
-from scipy.integrate import odeint
+from scipy.integrate import odeint, solve_ivp
 
+from analysis.analysis_settings import OUTCOME_BUDGET_EXCEEDED
 from models.biology import *
 from models.systems.open2 import get_equations as open2
+from models.systems.open2 import get_steady_state as open2_steady_state
 
 
 def get_parameter_set(filename) -> list:
@@ -35,10 +38,83 @@ def get_equations(system: str):
         raise Exception("No such system found :%s" % system)
 
 
+def get_flux_balance_ss(system: str, enzymes: dict):
+    """
+    Steady state without feedback from flux balance (see
+    models/systems/open2.get_steady_state)
+    :param system: topology or known model
+    :param enzymes: dict of enzymes
+    :return: steady state or None if system has no closed form
+    """
+    if system == S_OPEN_2:
+        return np.asarray(open2_steady_state(enzymes))
+    return None
+
+
 def extract_enz_from_log(log_text: str):
     return json.loads(log_text.split(":", 1)[1])["Enzymes"]
 
 
+def extract_record_from_log(log_text: str) -> tuple:
+    """
+    Splits single line of output file into UID and its record
+    :param log_text: line from output file
+    :return: (uid, dictionary of record)
+    """
+    uid, record = log_text.split(":", 1)
+    return uid.strip(), json.loads(record)
+
+
+def is_budget_record(record: dict) -> bool:
+    """
+    True if record only marks point whose integration exceeded its budget
+    (such record has no recovery data)
+    """
+    return record.get("outcome") == OUTCOME_BUDGET_EXCEEDED
+
+
+def get_run_settings(script_log: str, uid: str):
+    """
+    Finds analysis details logged at the start of scan
+    :param script_log: script log file
+    :param uid: UID of job
+    :return: dictionary of settings or None if not found
+    """
+    if script_log is None or not os.path.exists(script_log):
+        return None
+    with open(script_log) as f:
+        for line in f:
+            if not line.startswith(uid):
+                continue
+            try:
+                data = json.loads(line.split(" : ", 1)[1])
+            except (IndexError, ValueError):
+                continue
+            if isinstance(data, dict) and data.get("UID") == uid:
+                return data
+    return None
+
+
+def get_output_records(filename: str, uid: str = None) -> list:
+    """
+    Reads all records with recovery data from output file
+    :param filename: output file
+    :param uid: if given, only records of this job are returned
+    :return: list of record dictionaries
+    """
+    records = []
+    with open(filename) as f:
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            current_uid, record = extract_record_from_log(line)
+            if is_budget_record(record):
+                continue
+            if uid is None or current_uid == uid:
+                records.append(record)
+    return records
+
+
 def get_concentration_profile(system: str, initial_condition, parameters: dict,
                               ode_time: int, slices: int):
     """
@@ -130,3 +206,49 @@ def give_stimulus(ini_cond, depletion_percentage):
     sim_ss[I_DAG] = sim_ss[I_DAG] + sim_ss[I_PIP2] - amount
     sim_ss[I_PIP2] = amount
     return sim_ss
+
+
+def give_plc_stimulus(system: str, ini_cond, enzymes: dict, feed_para,
+                      depletion_percentage, factor: float, max_time: float,
+                      rtol: float = 1.49012e-8, atol: float = 1.49012e-8,
+                      equations=None):
+    """
+    Exact stimulus: PLC is stimulated by given factor and system is
+    integrated until PIP2 is depleted by given percentage. PLC is restored
+    to its original value afterwards.
+    :param system: topology or known model
+    :param ini_cond: Initial conditions (steady state before stimulus)
+    :param enzymes: dict of enzymes
+    :param feed_para: feedback parameters (or None)
+    :param depletion_percentage: Percentage depletion in PIP2
+    :param factor: stimulation factor of PLC
+    :param max_time: maximum duration of stimulus
+    :param rtol: relative tolerance (default is same as odeint)
+    :param atol: absolute tolerance (default is same as odeint)
+    :param equations: equations of system (default: get_equations(system))
+    :return: (lipid concentrations after stimulation, number of function
+    evaluations). Concentrations are None if depletion is not reached
+    within max_time
+    """
+    if equations is None:
+        equations = get_equations(system)
+    target = ini_cond[I_PIP2] * (100 - depletion_percentage) / 100
+
+    def depleted(t, y):
+        return y[I_PIP2] - target
+
+    depleted.terminal = True
+    depleted.direction = -1
+
+    plc = enzymes[E_PLC]  # type: Enzyme
+    original = plc.k, plc.v
+    plc.stimulate(factor)
+    try:
+        output = solve_ivp(lambda t, y: equations(y, t, enzymes, feed_para),
+                           (0, max_time), ini_cond, method="LSODA",
+                           events=depleted, rtol=rtol, atol=atol)
+    finally:
+        plc.k, plc.v = original
+    if len(output.t_events[0]) == 0:
+        return None, output.nfev
+    return list(output.y_events[0][0]), output.nfev
@@ -0,0 +1,73 @@
+"""
+Fixed-bin histograms which can be updated incrementally and merged.
+Used for summaries of (possibly running or sharded) scan outputs.
+"""
+import numpy as np
+
+
+class FixedHistogram:
+    """
+    Histogram with fixed bin edges.
+    counts[0] stores values below first edge and counts[-1] stores values
+    equal or above last edge.
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=int)
+        self.total = 0.0
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def mean(self) -> float:
+        if self.count == 0:
+            return float("nan")
+        return self.total / self.count
+
+    def add(self, values) -> None:
+        """
+        Adds values to histogram. Non-finite values are ignored.
+        :param values: single value or iterable of values
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        values = values[np.isfinite(values)]
+        ind = np.searchsorted(self.edges, values, side="right")
+        self.counts += np.bincount(ind, minlength=len(self.counts))
+        self.total += float(values.sum())
+
+    def merge(self, other: "FixedHistogram") -> None:
+        """
+        Adds counts of other histogram in this histogram
+        :param other: histogram with exactly same bin edges
+        """
+        if not np.array_equal(self.edges, other.edges):
+            raise Exception("Histograms with different bins can not be "
+                            "merged")
+        self.counts += other.counts
+        self.total += other.total
+
+    def fraction_above(self, value: float) -> float:
+        """
+        Approximate fraction of values above given value (bin resolution).
+        All values in bin which contains given value are counted, hence
+        it also includes values equal to it or slightly below it.
+        """
+        if self.count == 0:
+            return float("nan")
+        ind = np.searchsorted(self.edges, value, side="right")
+        return float(self.counts[ind:].sum()) / self.count
+
+    def to_dict(self) -> dict:
+        return {"edges": self.edges.tolist(),
+                "counts": self.counts.tolist(),
+                "total": self.total}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        temp = cls(data["edges"])
+        temp.counts = np.asarray(data["counts"], dtype=int)
+        temp.total = data["total"]
+        return temp
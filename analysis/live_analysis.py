@@ -0,0 +1,137 @@
+"""
+Live analysis of running scan.
+
+Follows growing output file and parses only records appended after last
+read. Byte offset and histogram summaries are persisted in state file next
+to the output file, hence analysis can be stopped and resumed any time
+without parsing whole file again.
+"""
+import os
+import time
+
+from analysis.feedback_visualize import get_without_feed_baseline
+from analysis.summary import *
+from utils.log import LOG
+
+
+class LiveState:
+    """
+    Byte offset of output file and summary of all records before it
+    """
+
+    def __init__(self, offset: int = 0, summary: ScanSummary = None):
+        self.offset = offset
+        self.summary = summary
+
+    def save(self, filename: str) -> None:
+        data = {"offset": self.offset, "summary": None}
+        if self.summary is not None:
+            data["summary"] = self.summary.to_dict()
+        # Write in temporary file first so that state is never half written
+        with open(filename + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(filename + ".tmp", filename)
+
+    @classmethod
+    def load(cls, filename: str):
+        if not os.path.exists(filename):
+            return cls()
+        with open(filename) as f:
+            data = json.load(f)
+        summary = None
+        if data["summary"] is not None:
+            summary = ScanSummary.from_dict(data["summary"])
+        return cls(data["offset"], summary)
+
+
+def read_new_lines(filename: str, offset: int) -> tuple:
+    """
+    Reads complete lines appended after given byte offset
+    :param filename: output file
+    :param offset: byte offset of last read
+    :return: (list of lines, new offset). Incomplete last line is not read.
+    """
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = data[:end].decode("utf-8").splitlines()
+    return lines, offset + end
+
+
+def update_live_state(state: LiveState, output_file: str, system: str,
+                      uid: str = None, script_log: str = None) -> int:
+    """
+    Adds newly appended records to summary
+    :param state: current state
+    :param output_file: output file of running scan
+    :param system: topology or known model
+    :param uid: if given, only records of this job are used
+    :param script_log: script log of scan. Recovery without feedback is
+    calculated with settings of scan (current settings if None).
+    :return: number of new records
+    """
+    if os.path.getsize(output_file) < state.offset:
+        raise Exception("Output file is smaller than stored offset. Delete "
+                        "state file to start again.")
+    lines, state.offset = read_new_lines(output_file, state.offset)
+    new_records = 0
+    for line in lines:
+        if len(line.strip()) == 0:
+            continue
+        current_uid, record = extract_record_from_log(line)
+        if uid is not None and current_uid != uid:
+            continue
+        if is_budget_record(record):
+            continue
+        if state.summary is None:
+            enz = convert_to_enzyme(record["Enzymes"])
+            settings = None
+            if script_log is not None:
+                settings = get_run_settings(script_log, current_uid)
+                if settings is None:
+                    raise Exception("Settings of job %s not found in %s" % (
+                        current_uid, script_log))
+            wf_para, no_feed_ss = get_without_feed_baseline(enz, system,
+                                                            settings)
+            state.summary = ScanSummary(wf_para, float(no_feed_ss[I_PI4P]))
+        state.summary.add(record)
+        new_records += 1
+    return new_records
+
+
+def follow_scan(output_file: str, system: str, uid: str = None,
+                interval: float = LIVE_REFRESH_INTERVAL,
+                state_file: str = None, max_updates: int = None,
+                script_log: str = None):
+    """
+    Follows output file of running scan and logs summary after every
+    interval. Stop with Ctrl+C.
+    :param output_file: output file of running scan
+    :param system: topology or known model
+    :param uid: if given, only records of this job are used
+    :param interval: time (in seconds) between two summaries
+    :param state_file: file to persist offset and summary (default is
+    output file name + ".live")
+    :param max_updates: stop after these many summaries (None for forever)
+    :param script_log: script log of scan (see update_live_state)
+    :return: final state
+    """
+    if state_file is None:
+        state_file = output_file + ".live"
+    state = LiveState.load(state_file)
+    updates = 0
+    try:
+        while max_updates is None or updates < max_updates:
+            new_records = update_live_state(state, output_file, system, uid,
+                                            script_log)
+            state.save(state_file)
+            if state.summary is not None:
+                LOG.info("%d new records\n%s" % (new_records,
+                                                 state.summary.report()))
+            updates += 1
+            if max_updates is None or updates < max_updates:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        state.save(state_file)
+    return state
@@ -0,0 +1,120 @@
+"""
+Headless report of all feedback figures.
+
+Output file is parsed only once. Every figure (also for every recovery
+point) is rendered with non-interactive backend in parallel worker
+processes and saved with unique name. Hash of inputs of every figure is
+stored in "manifest.json" in report folder; figures whose inputs did not
+change are not rendered again.
+"""
+import hashlib
+import multiprocessing
+import os
+
+from analysis.feedback_visualize import *
+from utils.log import LOG
+
+# Data of current report (set in every worker process)
+_REPORT_DATA = None
+
+
+def get_figures() -> dict:
+    """
+    All figures of report
+    :return: dictionary of figure name and (draw function, arguments)
+    """
+    figures = {"pi4p_depletion": (draw_depletion, ()),
+               "recovery_point_wise": (draw_recovery_point_wise, ())}
+    for index, point in enumerate(RECOVERY_POINTS):
+        figures["general_%s" % point] = (draw_general_core, (index,))
+        figures["pi4p_pip2_timing_%s" % point] = (draw_pi4p_pip2_timing,
+                                                  (index,))
+        figures["lipid_wise_%s" % point] = (draw_lipid_wise, (index,))
+        figures["enzyme_wise_%s" % point] = (draw_enzyme_wise, (index,))
+    return figures
+
+
+def get_input_hash(output_file: str, system: str,
+                   script_log: str = None) -> str:
+    """
+    Hash of everything figures depend on: content of output file, system
+    and analysis settings (including all settings used to calculate
+    recovery without feedback, see get_without_feed_para)
+    :param script_log: script log of run (its settings are hashed too)
+    """
+    digest = hashlib.sha1()
+    with open(output_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    settings = [system, RECOVERY_POINTS, PERCENTAGE_DEPLETION,
+                NOT_RECOVERED, EXACT_STIMULUS, PLC_STIMULATION_FACTOR,
+                STIMULATION_MAX_TIME, RECOVERY_THRESHOLD_TOLERANCE,
+                ACCURACY_PROFILE,
+                ACCURACY_PROFILES[ACCURACY_PROFILE],
+                FLUX_BALANCE_STEADY_STATE,
+                get_output_settings(output_file, script_log)]
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _init_worker(data: list) -> None:
+    global _REPORT_DATA
+    _REPORT_DATA = data
+    # Figures are only saved, never shown
+    plt.switch_backend("Agg")
+
+
+def _render(task: tuple) -> str:
+    name, filename = task
+    draw, args = get_figures()[name]
+    plt.figure()
+    draw(_REPORT_DATA, *args)
+    plt.savefig(filename, format='png', dpi=300, bbox_inches='tight')
+    plt.close("all")
+    return name
+
+
+def render_report(output_file: str, system: str, report_folder: str,
+                  processes: int = None, force: bool = False,
+                  script_log: str = None) -> list:
+    """
+    Renders all figures of report
+    :param output_file: output file of scan
+    :param system: topology or known model
+    :param report_folder: folder where figures are saved
+    :param processes: number of worker processes (default: number of cores)
+    :param force: if True, all figures are rendered again
+    :param script_log: script log of run. Recovery without feedback is
+    calculated with settings of run (current settings if None).
+    :return: list of rendered figures
+    """
+    if not os.path.exists(report_folder):
+        os.makedirs(report_folder)
+    manifest_file = os.path.join(report_folder, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    input_hash = get_input_hash(output_file, system, script_log)
+    tasks = []
+    for name in get_figures():
+        filename = os.path.join(report_folder, "%s.png" % name)
+        if manifest.get(name) == input_hash and os.path.exists(filename):
+            continue
+        tasks.append((name, filename))
+
+    if len(tasks) == 0:
+        LOG.info("Report is up to date")
+        return []
+
+    all_data = get_parameters(output_file, system, script_log)
+    with multiprocessing.Pool(processes, _init_worker, (all_data,)) as pool:
+        rendered = pool.map(_render, tasks)
+
+    for name in rendered:
+        manifest[name] = input_hash
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    LOG.info("Rendered %d figures in %s" % (len(rendered), report_folder))
+    return rendered
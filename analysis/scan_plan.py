@@ -0,0 +1,153 @@
+"""
+Declarative scan plan.
+
+Plan is ordered list of named axes with their values. Grid points are
+never materialized: size is product of axis lengths, every point is
+calculated from its index (last axis changes fastest, same order as
+itertools.product) and iteration is lazy. Plan can be split into
+deterministic shards and serialized in run metadata so that any worker
+can rebuild exactly the same subset of points.
+"""
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+
+def _to_json_value(value):
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    return value
+
+
+class ScanPlan:
+    """
+    Grid of scan with optional [start, stop) subset of point indices
+    """
+
+    def __init__(self, axes: list, start: int = 0, stop: int = None):
+        """
+        :param axes: list of (name, values). Duplicate values are removed.
+        :param start: index of first point of this plan
+        :param stop: index after last point (default: end of grid)
+        """
+        self.names = [name for name, _ in axes]
+        # Number of times every value was given (needed to count duplicate
+        # points of shards)
+        self.counts = [Counter(_to_json_value(v) for v in values)
+                       for _, values in axes]
+        self.values = [list(c) for c in self.counts]
+        if stop is None:
+            stop = self.grid_size
+        if not 0 <= start <= stop <= self.grid_size:
+            raise Exception("Invalid range of scan plan [%d, %d)" % (start,
+                                                                    stop))
+        self.start = start
+        self.stop = stop
+
+    @property
+    def grid_size(self) -> int:
+        """
+        Number of points in whole grid (not only in this shard)
+        """
+        return int(np.prod([len(v) for v in self.values], dtype=object))
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def duplicates(self) -> int:
+        """
+        Number of duplicate points removed from range of this plan (points
+        which differ from kept point only in order of duplicate values)
+        """
+        if self.start == 0 and self.stop == self.grid_size:
+            return int(np.prod([sum(c.values()) for c in self.counts],
+                               dtype=object)) - self.grid_size
+        return sum(int(np.prod([c[v] for c, v in zip(self.counts, point)],
+                               dtype=object)) - 1 for point in self)
+
+    def point(self, index: int) -> tuple:
+        """
+        Grid point at given index of whole grid
+        """
+        point = []
+        for values in reversed(self.values):
+            index, ind = divmod(index, len(values))
+            point.append(values[ind])
+        return tuple(reversed(point))
+
+    def points(self, start: int = None, stop: int = None):
+        """
+        Lazily yields points with indices in [start, stop)
+        """
+        if start is None:
+            start = self.start
+        if stop is None:
+            stop = self.stop
+        for index in range(start, stop):
+            yield self.point(index)
+
+    def __iter__(self):
+        return self.points()
+
+    def get_axes(self) -> list:
+        """
+        Axes as given to this plan (values with all their duplicates)
+        """
+        return [(name, list(c.elements())) for name, c in zip(self.names,
+                                                             self.counts)]
+
+    def shard(self, shard: int, shards: int) -> "ScanPlan":
+        """
+        Deterministic contiguous part of this plan
+        :param shard: index of shard (0 to shards - 1)
+        :param shards: total number of shards
+        """
+        if not 0 <= shard < shards:
+            raise Exception("Shard %d does not exist in %d shards" % (
+                shard, shards))
+        size = len(self)
+        return ScanPlan(self.get_axes(),
+                        self.start + shard * size // shards,
+                        self.start + (shard + 1) * size // shards)
+
+    def sample(self, samples: int, seed: int = 0) -> list:
+        """
+        Deterministic random sample of points of this plan
+        """
+        samples = min(samples, len(self))
+        indices = random.Random(seed).sample(range(self.start, self.stop),
+                                             samples)
+        return [self.point(index) for index in indices]
+
+    def estimate_runtime(self, solve, samples: int = 20,
+                         seed: int = 0) -> float:
+        """
+        Estimates runtime of whole plan from short calibration sample
+        :param solve: function which solves single point (point is given
+        as arguments)
+        :param samples: number of calibration points
+        :param seed: seed of random sample
+        :return: estimated time in seconds
+        """
+        points = self.sample(samples, seed)
+        if len(points) == 0:
+            return 0.0
+        begin = time.time()
+        for point in points:
+            solve(*point)
+        return (time.time() - begin) / len(points) * len(self)
+
+    def to_dict(self) -> dict:
+        # Duplicates are kept so that rebuilt plan counts them too
+        return {"axes": [[name, values] for name, values in
+                         self.get_axes()],
+                "start": self.start,
+                "stop": self.stop}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls([(name, values) for name, values in data["axes"]],
+                   data["start"], data["stop"])
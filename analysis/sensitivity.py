@@ -0,0 +1,272 @@
+"""
+Variance based global sensitivity of feedback parameters.
+
+Instead of full-factorial grid, hill coefficient, carrying capacity and
+multiplication factor are sampled as continuous parameters (in log space,
+within limits of scan ranges) with scrambled Sobol sequence and Saltelli
+scheme: two base matrices A and B of N samples and d matrices AB_i (A with
+column i taken from B). Every configuration (enzyme, substrate, type of
+feedback) needs N(d + 2) solves (160 for N = 32) instead of 675 grid points.
+
+Response is time at which PIP2 crosses given recovery point, linearly
+interpolated between time points of recovery (timings in output records
+are resolved only to single time step, which is large part of early
+timings). Points which do not recover are given end of recovery time.
+First order indices use estimator of Saltelli (2010) and total indices
+estimator of Jansen (1999). Confidence intervals are calculated by
+bootstrap over sample rows.
+Samples rejected by the scan (steady state changed) have no response.
+Index of parameter i uses only rows in which A, B and AB_i are accepted,
+other rows are removed. Indices are therefore of response conditional on
+acceptance and are biased towards the interior of accepted region: row
+close to boundary of rejected region is more likely to lose one of its
+samples. With many rejected samples (see "rows" of every index) indices
+should be read only qualitatively. Samples which exceed solve budget are
+retried with larger budget after all other samples of the configuration.
+"""
+from itertools import product
+
+from scipy.stats import norm, qmc
+
+from analysis.feedback_scaling import *
+
+SENSITIVITY_PARAMETERS = [F_HILL_COEFFICIENT, F_CARRYING_CAPACITY,
+                          F_MULTIPLICATION_FACTOR]
+
+
+def get_log_bounds() -> np.ndarray:
+    """
+    :return: (d x 2) array of log10 limits of continuous parameters
+    """
+    ranges = [RANGE_HILL_COEFFICIENT, RANGE_CARRY,
+              RANGE_MULTIPLICATION_FACTOR]
+    return np.log10([[min(r), max(r)] for r in ranges])
+
+
+def saltelli_sample(samples: int, seed: int = 0) -> tuple:
+    """
+    Saltelli sample of continuous feedback parameters
+    :param samples: number of base samples (N), should be power of 2
+    :param seed: seed of scrambled Sobol sequence
+    :return: (A, B, AB) with shapes (N, d), (N, d) and (d, N, d)
+    """
+    if samples < 2 or samples & (samples - 1) != 0:
+        raise Exception("Number of Sobol samples should be power of 2")
+    bounds = get_log_bounds()
+    dim = len(bounds)
+    base = qmc.Sobol(2 * dim, seed=seed).random_base2(int(np.log2(samples)))
+    base = np.power(10, bounds[:, 0] + base.reshape(
+        samples, 2, dim) * (bounds[:, 1] - bounds[:, 0]))
+    a, b = base[:, 0], base[:, 1]
+    ab = np.repeat(a[None, :, :], dim, axis=0)
+    for i in range(dim):
+        ab[i, :, i] = b[:, i]
+    return a, b, ab
+
+
+def get_crossing_time(lipid_array, threshold, time_points) -> float:
+    """
+    Time at which lipid first crosses threshold, linearly interpolated
+    between time points (end of recovery time if it never does)
+    """
+    lipid_array = np.asarray(lipid_array)
+    crossed = np.flatnonzero(lipid_array > threshold)
+    if len(crossed) == 0:
+        return float(recovery_time[-1])
+    i = crossed[0]
+    if i == 0:
+        return float(time_points[0])
+    y0, y1 = lipid_array[i - 1], lipid_array[i]
+    t0, t1 = time_points[i - 1], time_points[i]
+    return float(t0 + (threshold - y0) / (y1 - y0) * (t1 - t0))
+
+
+class ResponseRecorder:
+    """
+    Used as archive of solve_feedback_point: keeps response (interpolated
+    PIP2 crossing time) of the last solved point
+    """
+
+    def __init__(self, point=SENSITIVITY_RECOVERY_POINT):
+        """
+        :param point: PIP2 recovery point (percentage of steady state)
+        """
+        self.point = point
+        self.response = np.nan
+
+    def add(self, point: tuple, recovery_array, ss_lipids,
+            time_points) -> None:
+        threshold = get_threshold(ss_lipids[I_PIP2], self.point)
+        self.response = get_crossing_time(
+            np.asarray(recovery_array)[:, I_PIP2], threshold, time_points)
+
+    def get_response(self, record) -> float:
+        """
+        Response of record returned by the last solve (nan if point was
+        rejected or exceeded its budget)
+        """
+        response = self.response
+        self.response = np.nan
+        if record is None or is_budget_record(record):
+            return np.nan
+        return response
+
+
+def _indices(f_a, f_b, f_ab) -> tuple:
+    # Centering does not change estimators but reduces their error when
+    # mean is large compared to variance
+    mean = np.mean(np.concatenate((f_a, f_b)))
+    f_a, f_b, f_ab = f_a - mean, f_b - mean, f_ab - mean
+    variance = np.var(np.concatenate((f_a, f_b)))
+    if variance == 0:
+        return np.full(len(f_ab), np.nan), np.full(len(f_ab), np.nan)
+    first = np.mean(f_b * (f_ab - f_a), axis=1) / variance
+    total = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+    return first, total
+
+
+def sobol_indices(f_a, f_b, f_ab, bootstrap: int = SENSITIVITY_BOOTSTRAP,
+                  confidence: float = SENSITIVITY_CONFIDENCE,
+                  seed: int = 0) -> dict:
+    """
+    First order and total Sobol indices with confidence intervals
+    :param f_a: responses of A (N)
+    :param f_b: responses of B (N)
+    :param f_ab: responses of AB matrices (d x N)
+    :param bootstrap: number of bootstrap resamples
+    :param confidence: confidence level of intervals
+    :param seed: seed of bootstrap
+    :return: dictionary with "first", "first_conf", "total", "total_conf"
+    (confidence is half width of interval) and "rows" used by every index.
+    Indices with less than 2 rows or constant response are nan.
+    """
+    f_a, f_b, f_ab = np.asarray(f_a), np.asarray(f_b), np.asarray(f_ab)
+    dim = len(f_ab)
+    output = {key: np.full(dim, np.nan) for key in
+              ["first", "total", "first_conf", "total_conf"]}
+    output["rows"] = [0] * dim
+    rng = np.random.RandomState(seed)
+    z = norm.ppf(0.5 + confidence / 2)
+    for i in range(dim):
+        # Rows in which every sample needed by index i is accepted
+        valid = np.isfinite(f_a) & np.isfinite(f_b) & np.isfinite(f_ab[i])
+        a, b, ab = f_a[valid], f_b[valid], f_ab[i:i + 1, valid]
+        rows = len(a)
+        output["rows"][i] = rows
+        if rows < 2:
+            continue
+        first, total = _indices(a, b, ab)
+        output["first"][i], output["total"][i] = first[0], total[0]
+        if np.isnan(first[0]):
+            # Response is constant, index (and its interval) is undefined
+            continue
+        resampled = []
+        for _ in range(bootstrap):
+            r = rng.randint(rows, size=rows)
+            resampled.append(_indices(a[r], b[r], ab[:, r]))
+        resampled = np.asarray(resampled)[:, :, 0]
+        # Resamples with constant response have no indices
+        resampled = resampled[~np.isnan(resampled[:, 0])]
+        if len(resampled) > 1:
+            output["first_conf"][i] = z * np.std(resampled[:, 0])
+            output["total_conf"][i] = z * np.std(resampled[:, 1])
+    if max(output["rows"]) < 2:
+        raise Exception("Not enough valid samples for sensitivity indices")
+    return output
+
+
+def _to_json(values) -> list:
+    return [None if np.isnan(x) else float(x) for x in values]
+
+
+def scan_sensitivity(filename: str, system: str,
+                     samples: int = SENSITIVITY_SAMPLES, seed: int = 0,
+                     configurations: list = None,
+                     recovery_point=SENSITIVITY_RECOVERY_POINT) -> list:
+    """
+    Sobol sensitivity of PIP2 recovery to feedback parameters for every
+    configuration. Every solved point is saved in output file (same format
+    as grid scan) and indices of every configuration are logged.
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param samples: number of base samples (N)
+    :param seed: seed of Sobol sequence
+    :param configurations: list of (fed_type, sub_ind, enz) (default: all
+    combinations from scan ranges)
+    :param recovery_point: PIP2 recovery point used as response (should
+    be below 100, see SENSITIVITY_RECOVERY_POINT)
+    :return: list of dictionaries with configuration and indices
+    """
+    if configurations is None:
+        configurations = list(product(RANGE_FEED_TYPE, RANGE_SUBSTRATE,
+                                      RANGE_ENZYMES))
+    log_data = {
+        "UID": CURRENT_JOB,
+        "system": system,
+        "Analysis": "Feedback Sobol Sensitivity",
+        "sub_version": "1.1",
+        "number_of_feedback": 1,
+        "recovery_points": RECOVERY_POINTS,
+        "depletion_percentage": PERCENTAGE_DEPLETION,
+        "recovery_threshold_tolerance": RECOVERY_THRESHOLD_TOLERANCE,
+        "exact_stimulus": EXACT_STIMULUS,
+        "plc_stimulation_factor": PLC_STIMULATION_FACTOR,
+        "accuracy_profile": ACCURACY_PROFILE,
+        "sobol_samples": samples,
+        "sobol_seed": seed,
+        "response_point": recovery_point,
+        "response": "interpolated_pip2_crossing",
+        "version": "3.0"}
+    LOG.info(json.dumps(log_data, sort_keys=True))
+
+    enzymes = get_scaled_enzymes(filename, system)
+    init_con, no_feed_ss = get_no_feedback_ss(enzymes, system)
+    no_feed_recovery = get_no_feedback_recovery(system, enzymes, no_feed_ss)
+    a, b, ab = saltelli_sample(samples, seed)
+    matrices = [a, b] + list(ab)
+    dim = len(SENSITIVITY_PARAMETERS)
+
+    recorder = ResponseRecorder(recovery_point)
+
+    def solve(point, budget_factor=1):
+        data = solve_feedback_point(system, enzymes, init_con, no_feed_ss,
+                                    *point, no_feed_recovery=no_feed_recovery,
+                                    archive=recorder,
+                                    budget_factor=budget_factor)
+        if data is not None:
+            OUTPUT.info(json.dumps(data, sort_keys=True))
+        return data, recorder.get_response(data)
+
+    output = []
+    for counter, configuration in enumerate(configurations):
+        update_progress(counter / len(configurations))
+        fed_type, sub_ind, enz = configuration
+        responses = np.full((len(matrices), samples), np.nan)
+        slow_lane = []
+        for m, matrix in enumerate(matrices):
+            for row, para in enumerate(matrix):
+                data, responses[m, row] = solve(tuple(para) + configuration)
+                if data is not None and is_budget_record(data):
+                    slow_lane.append((m, row))
+        for m, row in slow_lane:
+            _, responses[m, row] = solve(tuple(matrices[m][row]) +
+                                         configuration,
+                                         SLOW_LANE_BUDGET_FACTOR)
+        f_a, f_b, f_ab = responses[0], responses[1], responses[2:]
+        result = {F_ENZYME: enz, F_FEED_SUBSTRATE_INDEX: sub_ind,
+                  F_TYPE_OF_FEEDBACK: fed_type,
+                  "parameters": SENSITIVITY_PARAMETERS,
+                  "solves": samples * (dim + 2)}
+        try:
+            indices = sobol_indices(f_a, f_b, f_ab, seed=seed)
+        except Exception as e:
+            result["error"] = str(e)
+            LOG.info(json.dumps(result, sort_keys=True))
+            output.append(result)
+            continue
+        result["rows"] = indices["rows"]
+        for key in ["first", "first_conf", "total", "total_conf"]:
+            result[key] = _to_json(indices[key])
+        LOG.info(json.dumps(result, sort_keys=True))
+        output.append(result)
+    return output
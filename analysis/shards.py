@@ -0,0 +1,221 @@
+"""
+Merging of sharded scan outputs.
+
+Scans split by hand (e.g. over RANGE_ENZYMES or RANGE_SUBSTRATE) produce
+several output files with different UIDs. Each shard (single UID) is
+summarized into compact JSON file containing its settings, scaled enzymes,
+list of grid points and fixed-bin histograms. Shards are merged from these
+summaries only; raw records are parsed again only when shards overlap.
+"""
+import os
+from collections import OrderedDict
+
+import matplotlib.gridspec as gridspec
+import matplotlib.pylab as plt
+
+from analysis.feedback_visualize import get_without_feed_baseline
+from analysis.summary import *
+from utils.log import LOG
+
+
+def get_point_key(record: dict) -> tuple:
+    """
+    Grid point of output record
+    :return: (enzyme, substrate index, feedback type, hill, carry, multi)
+    """
+    enz = list(record["fed_para"].keys())[0]
+    para = record["fed_para"][enz]
+    return (enz, para[F_FEED_SUBSTRATE_INDEX], para[F_TYPE_OF_FEEDBACK],
+            round(para[F_HILL_COEFFICIENT], 8),
+            round(para[F_CARRYING_CAPACITY], 8),
+            round(para[F_MULTIPLICATION_FACTOR], 8))
+
+
+def get_shard_records(output_file: str) -> OrderedDict:
+    """
+    Groups records of output file by UID
+    """
+    shards = OrderedDict()
+    with open(output_file) as f:
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            uid, record = extract_record_from_log(line)
+            if is_budget_record(record):
+                continue
+            shards.setdefault(uid, []).append(record)
+    return shards
+
+
+def summarize_records(uid: str, records: list, output_file: str,
+                      system: str, settings: dict = None,
+                      exclude: set = None) -> dict:
+    """
+    Creates shard summary from records of single job
+    :param uid: UID of job
+    :param records: output records of the job
+    :param output_file: file from which records are taken
+    :param system: topology or known model
+    :param settings: analysis details of the job (if known)
+    :param exclude: grid points which should not be included
+    :return: shard summary
+    """
+    if exclude is None:
+        exclude = set()
+    enz = convert_to_enzyme(records[0]["Enzymes"])
+    wf_para, no_feed_ss = get_without_feed_baseline(enz, system, settings)
+    summary = ScanSummary(wf_para, float(no_feed_ss[I_PI4P]))
+    points = []
+    seen = set(exclude)
+    for record in records:
+        key = get_point_key(record)
+        if key in seen:
+            continue
+        seen.add(key)
+        points.append(key)
+        summary.add(record)
+    return {"uid": uid,
+            "source": output_file,
+            "system": system,
+            "settings": settings,
+            "number_of_timings": len(records[0]["pip2_timings"]),
+            "enzymes": records[0]["Enzymes"],
+            "points": points,
+            "summary": summary.to_dict()}
+
+
+def write_shard_summaries(output_file: str, system: str,
+                          summary_folder: str, script_log: str) -> list:
+    """
+    Writes summary of every job (UID) present in output file
+    :param output_file: output file of scan
+    :param system: topology or known model
+    :param summary_folder: folder where "<UID>.json" summaries are stored
+    :param script_log: script log of scan (used to read its settings)
+    :return: list of summary files
+    """
+    if not os.path.exists(summary_folder):
+        os.makedirs(summary_folder)
+    files = []
+    for uid, records in get_shard_records(output_file).items():
+        settings = get_run_settings(script_log, uid)
+        if settings is None:
+            raise Exception("Settings of job %s not found in %s" % (
+                uid, script_log))
+        data = summarize_records(uid, records, output_file, system,
+                                 settings)
+        filename = os.path.join(summary_folder, "%s.json" % uid)
+        with open(filename, "w") as f:
+            json.dump(data, f)
+        files.append(filename)
+    return files
+
+
+def _same_enzymes(first: dict, second: dict) -> bool:
+    if set(first) != set(second):
+        return False
+    for e in first:
+        for p in ["k", "v"]:
+            a, b = first[e].get(p), second[e].get(p)
+            if (a is None) != (b is None):
+                return False
+            if a is not None and not np.isclose(a, b,
+                                                rtol=SHARD_ENZYME_TOLERANCE):
+                return False
+        if first[e]["kinetics"] != second[e]["kinetics"]:
+            return False
+    return True
+
+
+def validate_shards(shards: list) -> None:
+    """
+    Checks that all shards come from same scaled enzymes and settings
+    """
+    for s in shards:
+        if s["settings"] is None:
+            raise Exception("Shard %s has no settings, it can not be "
+                            "validated" % s["uid"])
+    base = shards[0]
+    for s in shards[1:]:
+        if s["system"] != base["system"]:
+            raise Exception("Shard %s has different system" % s["uid"])
+        if s["number_of_timings"] != base["number_of_timings"]:
+            raise Exception("Shard %s has different recovery points" %
+                            s["uid"])
+        if not _same_enzymes(base["enzymes"], s["enzymes"]):
+            raise Exception("Shard %s has different scaled enzymes" %
+                            s["uid"])
+        for key in SHARD_SETTINGS:
+            if s["settings"].get(key) != base["settings"].get(key):
+                raise Exception("Shard %s has different setting %s" % (
+                    s["uid"], key))
+
+
+def merge_shards(summary_files: list, system: str) -> ScanSummary:
+    """
+    Merges shard summaries. If shard overlaps with earlier shards, its
+    summary is created again from its source file without overlapping
+    grid points.
+    :param summary_files: list of shard summary files
+    :param system: topology or known model
+    :return: merged summary
+    """
+    shards = []
+    for filename in summary_files:
+        with open(filename) as f:
+            shards.append(json.load(f))
+    validate_shards(shards)
+
+    merged = ScanSummary(shards[0]["summary"]["wf_para"],
+                         shards[0]["summary"].get("pi4p_ss"))
+    covered = set()
+    for s in shards:
+        points = set(tuple(x) for x in s["points"])
+        overlap = points & covered
+        if len(overlap) > 0:
+            LOG.info("Shard %s has %d overlapping points" % (s["uid"],
+                                                             len(overlap)))
+            records = get_shard_records(s["source"])[s["uid"]]
+            s = summarize_records(s["uid"], records, s["source"], system,
+                                  s["settings"], covered)
+            points = set(tuple(x) for x in s["points"])
+        merged.merge(ScanSummary.from_dict(s["summary"]))
+        covered |= points
+    LOG.info("Merged %d shards with %d unique points" % (len(shards),
+                                                         len(covered)))
+    return merged
+
+
+def plot_summary(summary: ScanSummary, group: str = "enzyme",
+                 metric: str = "diff") -> None:
+    """
+    Plots enzyme-wise or lipid-wise histograms from summary
+    :param summary: (merged) summary
+    :param group: "enzyme" or "substrate"
+    :param metric: one of the keys of summary.get_histogram_edges()
+    """
+    names = sorted(set(k.split(":")[1] for k in summary.histograms if
+                       k.startswith(group + ":")))
+    gs = gridspec.GridSpec(4, 3)
+    for grid_count, m in enumerate(names):
+        ax = plt.subplot(gs[grid_count])
+        for fed_type, color in [("positive", "b"), ("negative", "r")]:
+            key = "%s:%s:%s" % (group, m, fed_type)
+            if key not in summary.histograms:
+                continue
+            hist = summary.histograms[key][metric]
+            # Underflow and overflow bins are not plotted
+            ax.bar(hist.edges[:-1], hist.counts[1:-1],
+                   width=np.diff(hist.edges), align="edge", alpha=0.5,
+                   color=color)
+        if metric == "diff":
+            ax.axvline(1, linestyle="--", color="k")
+        if metric != "min_pi4p_ratio":
+            ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_yticks([])
+        ax.set_title(m)
+
+    plt.savefig("merged_%s_%s.png" % (group, metric), format='png', dpi=300,
+                bbox_inches='tight')
+    plt.show()
@@ -0,0 +1,154 @@
+"""
+Compact histogram summaries of feedback scan output.
+Summaries are grouped by feedback enzyme and feedback substrate (separately
+for positive and negative feedback) and can be updated record by record
+or merged with other summaries.
+"""
+from analysis.analysis_settings import *
+from analysis.feedback_scaling import get_recovery_time, recovery_time
+from analysis.feedback_visualize import DIFF_INDEX
+from analysis.helper import *
+from analysis.histogram import FixedHistogram
+
+FEEDBACK_NAMES = {FEEDBACK_POSITIVE: "positive",
+                  FEEDBACK_NEGATIVE: "negative"}
+
+
+def get_histogram_edges() -> dict:
+    """
+    Bin edges of every summary metric. Timing edges are log-spaced from
+    first time step of recovery (of the finest accuracy profile) to end of
+    recovery, hence they do not depend on profile.
+    """
+    first = min(get_recovery_time(p)[1] for p in ACCURACY_PROFILES)
+    timing = np.logspace(np.log10(first), np.log10(recovery_time[-1]),
+                         HISTOGRAM_TIMING_BINS + 1)
+    timing[0], timing[-1] = first, recovery_time[-1]
+    edges = dict(HISTOGRAM_EDGES)
+    edges["pip2_timing"] = timing
+    edges["pi4p_timing"] = timing
+    return edges
+
+
+def get_record_metrics(record: dict, wf_para: list = None,
+                       pi4p_ss: float = None) -> dict:
+    """
+    Calculates summary metrics of single output record
+    :param record: output record
+    :param wf_para: PIP2 timings without feedback (needed for "diff")
+    :param pi4p_ss: PI4P steady state without feedback (needed for
+    "min_pi4p_ratio")
+    :return: dictionary of metric values
+    """
+    timings = [record["pip2_timings"][DIFF_INDEX],
+               record["pi4p_timings"][DIFF_INDEX]]
+    # Not recovered points are ignored in timing and diff histograms
+    timings = [np.nan if x == NOT_RECOVERED else x for x in timings]
+    metrics = {"pip2_timing": timings[0],
+               "pi4p_timing": timings[1]}
+    if wf_para is not None:
+        metrics["diff"] = wf_para[DIFF_INDEX] / timings[0]
+    if pi4p_ss is not None:
+        metrics["min_pi4p_ratio"] = record["min_pi4p"] / pi4p_ss
+    return metrics
+
+
+def get_group_keys(record: dict) -> list:
+    """
+    Summary groups to which record belongs
+    """
+    enz = list(record["fed_para"].keys())[0]
+    para = record["fed_para"][enz]
+    fed_type = FEEDBACK_NAMES[para[F_TYPE_OF_FEEDBACK]]
+    substrate = get_lipid_from_index(para[F_FEED_SUBSTRATE_INDEX])
+    return ["enzyme:%s:%s" % (enz, fed_type),
+            "substrate:%s:%s" % (substrate, fed_type)]
+
+
+class ScanSummary:
+    """
+    Per-enzyme and per-substrate histograms of scan output.
+    Number of records with diff strictly above 1 (faster recovery than
+    without feedback) is counted exactly in "faster" because histogram bin
+    of 1 also contains values slightly above it.
+    """
+
+    def __init__(self, wf_para: list = None, pi4p_ss: float = None):
+        """
+        :param wf_para: PIP2 timings without feedback
+        :param pi4p_ss: PI4P steady state without feedback
+        """
+        self.wf_para = wf_para
+        self.pi4p_ss = pi4p_ss
+        self.records = 0
+        self.histograms = {}
+        # None if summary was created without exact counts
+        self.faster = {}
+
+    def _get_group(self, key: str) -> dict:
+        if key not in self.histograms:
+            edges = get_histogram_edges()
+            self.histograms[key] = {m: FixedHistogram(edges[m])
+                                    for m in edges}
+        return self.histograms[key]
+
+    def add(self, record: dict) -> None:
+        metrics = get_record_metrics(record, self.wf_para, self.pi4p_ss)
+        for key in get_group_keys(record):
+            group = self._get_group(key)
+            for m in metrics:
+                group[m].add(metrics[m])
+            if self.faster is not None and metrics.get("diff", 0) > 1:
+                self.faster[key] = self.faster.get(key, 0) + 1
+        self.records += 1
+
+    def merge(self, other: "ScanSummary") -> None:
+        for key in other.histograms:
+            group = self._get_group(key)
+            for m in other.histograms[key]:
+                group[m].merge(other.histograms[key][m])
+        if self.faster is None or other.faster is None:
+            self.faster = None
+        else:
+            for key in other.faster:
+                self.faster[key] = self.faster.get(key, 0) + other.faster[
+                    key]
+        self.records += other.records
+
+    def to_dict(self) -> dict:
+        return {"wf_para": self.wf_para,
+                "pi4p_ss": self.pi4p_ss,
+                "records": self.records,
+                "faster": self.faster,
+                "histograms": {key: {m: self.histograms[key][m].to_dict()
+                                     for m in self.histograms[key]}
+                               for key in self.histograms}}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        temp = cls(data["wf_para"], data.get("pi4p_ss"))
+        temp.records = data["records"]
+        temp.faster = data.get("faster")
+        temp.histograms = {
+            key: {m: FixedHistogram.from_dict(data["histograms"][key][m])
+                  for m in data["histograms"][key]}
+            for key in data["histograms"]}
+        return temp
+
+    def report(self) -> str:
+        """
+        Text summary of all groups
+        """
+        lines = ["Records : %d" % self.records]
+        for key in sorted(self.histograms):
+            group = self.histograms[key]
+            text = "%s n=%d mean_pip2=%.4g mean_pi4p=%.4g" % (
+                key, group["pip2_timing"].count,
+                group["pip2_timing"].mean, group["pi4p_timing"].mean)
+            if group["diff"].count > 0:
+                text += " mean_diff=%.4g" % group["diff"].mean
+                if self.faster is not None:
+                    text += " faster=%.1f%%" % (100 * self.faster.get(
+                        key, 0) / group["diff"].count)
+            lines.append(text)
+        return "\n".join(lines)
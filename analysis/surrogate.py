@@ -0,0 +1,306 @@
+"""
+Surrogate model of feedback scan.
+
+Gaussian process (RBF kernel) is fitted on records from output file. One
+model is kept for each enzyme/substrate/type of feedback and it predicts
+recovery timings of PIP2 and PI4P as well as minimum PI4P for any hill
+coefficient, carrying capacity and multiplication factor.
+Points which do not give same steady state as without feedback are
+rejected by the scan. Second model of every enzyme/substrate/type is
+fitted on acceptance (1 for solved and 0 for rejected points); points near
+boundary of rejected region are uncertain and points well inside it are
+predicted as rejected.
+Points where surrogate is uncertain are solved with real ODE solver and
+added back to the model.
+"""
+from collections import defaultdict
+
+from analysis.analysis_settings import *
+from analysis.feedback_scaling import get_no_feedback_ss, recovery_time, \
+    solve_feedback_point, get_no_feedback_recovery
+from analysis.scan_plan import ScanPlan
+from analysis.helper import *
+from utils.log import OUTPUT
+
+# Outputs predicted by surrogate (in this order)
+SURROGATE_OUTPUTS = ["pip2_timings", "pi4p_timings", "min_pi4p"]
+
+
+def _log_normalize(value, value_range) -> float:
+    low = np.log10(min(value_range))
+    high = np.log10(max(value_range))
+    if high == low:
+        return 0.0
+    return (np.log10(value) - low) / (high - low)
+
+
+def get_features(hill, carry, multi) -> np.ndarray:
+    """
+    Converts feedback parameters to normalized feature vector
+    All parameters are scanned on log scale, hence log normalization
+    """
+    return np.asarray([_log_normalize(hill, RANGE_HILL_COEFFICIENT),
+                       _log_normalize(carry, RANGE_CARRY),
+                       _log_normalize(multi, RANGE_MULTIPLICATION_FACTOR)])
+
+
+def record_to_targets(record: dict) -> np.ndarray:
+    """
+    Flattens output record into target vector.
+    NOT_RECOVERED timings are censored at end of recovery time.
+    """
+    timings = np.asarray(record["pip2_timings"] + record["pi4p_timings"],
+                         dtype=float)
+    timings[timings == NOT_RECOVERED] = recovery_time[-1]
+    return np.append(timings, record["min_pi4p"])
+
+
+def targets_to_prediction(targets) -> dict:
+    """
+    Converts target vector back to format of output record
+    """
+    n = len(RECOVERY_POINTS)
+    timings = [NOT_RECOVERED if x >= recovery_time[-1] else float(x) for x in
+               targets[:2 * n]]
+    return {"pip2_timings": timings[:n],
+            "pi4p_timings": timings[n:],
+            "min_pi4p": float(targets[-1])}
+
+
+def get_record_key(record: dict) -> tuple:
+    """
+    Returns (enzyme, substrate index, type of feedback), hill, carry and
+    multiplication factor of given record
+    """
+    enz = list(record["fed_para"].keys())[0]
+    para = record["fed_para"][enz]
+    key = (enz, para[F_FEED_SUBSTRATE_INDEX], para[F_TYPE_OF_FEEDBACK])
+    return key, para[F_HILL_COEFFICIENT], para[F_CARRYING_CAPACITY], para[
+        F_MULTIPLICATION_FACTOR]
+
+
+class _GaussianProcess:
+    """
+    Minimal multi-output Gaussian process with fixed RBF kernel
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, length_scale: float,
+                 noise: float):
+        self.x = x
+        self.length_scale = length_scale
+        self.y_mean = y.mean(axis=0)
+        self.y_std = y.std(axis=0)
+        # Constant targets are only shifted (their deviation stays 0)
+        self.y_scale = np.where(self.y_std == 0, 1, self.y_std)
+        k = self._kernel(x, x) + noise * np.eye(len(x))
+        self.chol = np.linalg.cholesky(k)
+        self.alpha = np.linalg.solve(
+            self.chol.T, np.linalg.solve(self.chol, (y - self.y_mean) /
+                                         self.y_scale))
+
+    def _kernel(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        d = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * d / self.length_scale ** 2)
+
+    def predict(self, x: np.ndarray) -> tuple:
+        """
+        :param x: array of features
+        :return: mean, standard deviation (in units of targets) and
+        normalized standard deviation (between 0 and 1)
+        """
+        k_star = self._kernel(x, self.x)
+        mean = k_star.dot(self.alpha) * self.y_scale + self.y_mean
+        v = np.linalg.solve(self.chol, k_star.T)
+        var = np.clip(1 - (v ** 2).sum(axis=0), 0, None)
+        norm_std = np.sqrt(var)
+        return mean, norm_std[:, None] * self.y_std, norm_std
+
+
+class FeedbackSurrogate:
+    """
+    Collection of surrogate models, one for each enzyme/substrate/type
+    """
+
+    def __init__(self, length_scale=SURROGATE_LENGTH_SCALE,
+                 noise=SURROGATE_NOISE,
+                 max_uncertainty=SURROGATE_MAX_UNCERTAINTY):
+        self.length_scale = length_scale
+        self.noise = noise
+        self.max_uncertainty = max_uncertainty
+        self.data = defaultdict(dict)
+        self.rejected = set()
+        self.rejected_features = defaultdict(set)
+        self.models = {}
+        self.classifiers = {}
+
+    def add(self, record: dict) -> None:
+        """
+        Adds output record to training data. Duplicate points are replaced.
+        """
+        key, hill, carry, multi = get_record_key(record)
+        features = get_features(hill, carry, multi)
+        features = tuple(np.round(features, 10))
+        self.data[key][features] = record_to_targets(record)
+        self.rejected_features[key].discard(features)
+        self.models.pop(key, None)
+        self.classifiers.pop(key, None)
+
+    def add_rejected(self, point: tuple) -> None:
+        """
+        Remembers point which did not give same steady state as without
+        feedback. Such points are never sent to solver again.
+        :param point: (hill, carry, multi, fed_type, sub_ind, enz)
+        """
+        self.rejected.add(tuple(point))
+        hill, carry, multi, fed_type, sub_ind, enz = point
+        key = (enz, sub_ind, fed_type)
+        features = tuple(np.round(get_features(hill, carry, multi), 10))
+        if features not in self.data[key]:
+            self.rejected_features[key].add(features)
+            self.classifiers.pop(key, None)
+
+    def _get_model(self, key: tuple):
+        if key not in self.models:
+            if len(self.data[key]) == 0:
+                return None
+            x = np.asarray(list(self.data[key].keys()))
+            y = np.asarray(list(self.data[key].values()))
+            self.models[key] = _GaussianProcess(x, y, self.length_scale,
+                                                self.noise)
+        return self.models[key]
+
+    def _get_classifier(self, key: tuple):
+        """
+        Model of acceptance (None if no point of key was rejected)
+        """
+        if len(self.rejected_features[key]) == 0:
+            return None
+        if key not in self.classifiers:
+            accepted = list(self.data[key].keys())
+            rejected = list(self.rejected_features[key])
+            x = np.asarray(accepted + rejected)
+            y = np.asarray([1.0] * len(accepted) + [0.0] * len(rejected))
+            self.classifiers[key] = _GaussianProcess(
+                x, y[:, None], self.length_scale, self.noise)
+        return self.classifiers[key]
+
+    def predict(self, hill, carry, multi, fed_type, sub_ind, enz) -> tuple:
+        """
+        Predicts output of single feedback point
+        :return: (prediction, standard deviation, normalized uncertainty)
+        prediction and standard deviation are in format of output record.
+        Uncertainty is larger of uncertainty of prediction and of
+        acceptance (1 at boundary of rejected region). If point is
+        predicted to be rejected or there is no data for this
+        enzyme/substrate/type, prediction and deviation are None (with
+        uncertainty 1 in later case).
+        """
+        key = (enz, sub_ind, fed_type)
+        features = get_features(hill, carry, multi)[None, :]
+        uncertainty = 0.0
+        classifier = self._get_classifier(key)
+        if classifier is not None:
+            accepted = float(np.clip(classifier.predict(features)[0][0, 0],
+                                     0, 1))
+            uncertainty = 1 - abs(2 * accepted - 1)
+            if accepted < 0.5:
+                return None, None, uncertainty
+        model = self._get_model(key)
+        if model is None:
+            return None, None, 1.0
+        mean, std, norm_std = model.predict(features)
+        n = len(RECOVERY_POINTS)
+        deviation = {"pip2_timings": [float(x) for x in std[0][:n]],
+                     "pi4p_timings": [float(x) for x in std[0][n:2 * n]],
+                     "min_pi4p": float(std[0][-1])}
+        return targets_to_prediction(mean[0]), deviation, max(
+            uncertainty, float(norm_std[0]))
+
+    def is_uncertain(self, uncertainty: float) -> bool:
+        return uncertainty > self.max_uncertainty
+
+
+def get_surrogate(output_file: str, uid: str = None,
+                  plan: ScanPlan = None) -> FeedbackSurrogate:
+    """
+    Trains surrogate on records from output file
+    :param output_file: output file of scan
+    :param uid: UID of job (if None, all records are used)
+    :param plan: plan of finished scan which produced output. Its grid
+    points without any record (also without budget record) were rejected
+    and are added as such. Without plan, only accepted points are known.
+    :return: trained surrogate
+    """
+    surrogate = FeedbackSurrogate()
+    seen = set()
+    with open(output_file) as f:
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            current_uid, record = extract_record_from_log(line)
+            if uid is not None and current_uid != uid:
+                continue
+            key, hill, carry, multi = get_record_key(record)
+            seen.add((key, tuple(np.round(get_features(hill, carry, multi),
+                                          10))))
+            if not is_budget_record(record):
+                surrogate.add(record)
+    if plan is not None:
+        for point in plan:
+            hill, carry, multi, fed_type, sub_ind, enz = point
+            if ((enz, sub_ind, fed_type), tuple(np.round(get_features(
+                    hill, carry, multi), 10))) not in seen:
+                surrogate.add_rejected(point)
+    return surrogate
+
+
+def query_feedback(surrogate: FeedbackSurrogate, enzymes: dict, system: str,
+                   points: list) -> list:
+    """
+    Predicts feedback points with surrogate. Uncertain points are solved
+    with ODE solver, logged in output file and fed back to surrogate.
+    :param surrogate: trained surrogate
+    :param enzymes: scaled enzymes without feedback (same as in scan)
+    :param system: topology or known model
+    :param points: list of (hill, carry, multi, fed_type, sub_ind, enz)
+    :return: list of (prediction, standard deviation, solved) for each
+    point. Prediction is None if point did not (or is predicted not to)
+    give same steady state as without feedback
+    """
+    results = []
+    baseline = None
+    for point in points:
+        if point in surrogate.rejected:
+            results.append((None, None, True))
+            continue
+        prediction, deviation, uncertainty = surrogate.predict(*point)
+        if not surrogate.is_uncertain(uncertainty):
+            results.append((prediction, deviation, False))
+            continue
+
+        if baseline is None:
+            baseline = get_no_feedback_ss(enzymes, system)
+            baseline += (get_no_feedback_recovery(system, enzymes,
+                                                  baseline[1]),)
+        data = solve_feedback_point(system, enzymes, baseline[0],
+                                    baseline[1], *point,
+                                    no_feed_recovery=baseline[2])
+        if data is not None and is_budget_record(data):
+            OUTPUT.info(json.dumps(data, sort_keys=True))
+            data = solve_feedback_point(
+                system, enzymes, baseline[0], baseline[1], *point,
+                no_feed_recovery=baseline[2],
+                budget_factor=SLOW_LANE_BUDGET_FACTOR)
+            if data is not None and is_budget_record(data):
+                OUTPUT.info(json.dumps(data, sort_keys=True))
+                results.append((None, None, True))
+                continue
+        if data is None:
+            surrogate.add_rejected(point)
+            results.append((None, None, True))
+            continue
+
+        OUTPUT.info(json.dumps(data, sort_keys=True))
+        surrogate.add(data)
+        results.append(({k: data[k] for k in SURROGATE_OUTPUTS}, None, True))
+    return results
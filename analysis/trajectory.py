@@ -0,0 +1,158 @@
+"""
+Archive of recovery trajectories.
+
+Recovery curves are thinned to TRAJECTORY_SAMPLES points on log-spaced time
+grid (dense in early recovery) and stored as float32 in chunks of
+TRAJECTORY_CHUNK_SIZE grid points. Thinning and float32 already make every
+curve ~50 times smaller; chunks are stored as plain .npy files (not
+further compressed) so that they can be memory-mapped. Index of grid
+points is kept in "index.json".
+
+New metrics can be calculated on whole scan with TrajectoryArchive.apply
+without integrating again.
+"""
+import json
+import os
+
+import numpy as np
+
+from analysis.analysis_settings import *
+from analysis.feedback_scaling import recovery_time
+
+# Time points of archived trajectories
+TRAJECTORY_TIME = np.concatenate(([0], np.logspace(
+    np.log10(recovery_time[1]), np.log10(recovery_time[-1]),
+    TRAJECTORY_SAMPLES - 1)))
+
+
+def thin_trajectory(recovery_array, time_points) -> np.ndarray:
+    """
+    Interpolates recovery on TRAJECTORY_TIME
+    :param recovery_array: output of recovery integration
+    :param time_points: recovery time of integration (depends on accuracy
+    profile)
+    """
+    recovery_array = np.asarray(recovery_array)
+    return np.stack([np.interp(TRAJECTORY_TIME, time_points,
+                               recovery_array[:, i])
+                     for i in range(recovery_array.shape[1])],
+                    axis=1).astype(np.float32)
+
+
+class TrajectoryArchive:
+    """
+    Chunked, memory-mapped store of thinned recovery trajectories indexed
+    by grid point (hill, carry, multi, fed_type, sub_ind, enz)
+    """
+
+    def __init__(self, folder: str, chunk_size: int = TRAJECTORY_CHUNK_SIZE):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.index = {}
+        self.chunks = 0
+        self._curves = []
+        self._ss = []
+        self._points = []
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        index_file = os.path.join(folder, "index.json")
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                data = json.load(f)
+            self.chunks = data["chunks"]
+            self.index = {tuple(x[:6]): (x[6], x[7]) for x in data["points"]}
+
+    def __len__(self):
+        return len(self.index) + len(self._points)
+
+    def _chunk_file(self, chunk: int, kind: str) -> str:
+        return os.path.join(self.folder, "%s_%05d.npy" % (kind, chunk))
+
+    def add(self, point: tuple, recovery_array, ss_lipids,
+            time_points) -> None:
+        """
+        Adds trajectory of single grid point
+        :param point: (hill, carry, multi, fed_type, sub_ind, enz)
+        :param recovery_array: output of recovery integration
+        :param ss_lipids: steady state before stimulus
+        :param time_points: recovery time of integration (see
+        feedback_scaling.get_recovery_time)
+        """
+        self._points.append(tuple(point))
+        self._curves.append(thin_trajectory(recovery_array, time_points))
+        self._ss.append(np.asarray(ss_lipids, dtype=np.float32))
+        if len(self._points) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes buffered trajectories as new chunk and updates index
+        """
+        if len(self._points) > 0:
+            np.save(self._chunk_file(self.chunks, "curves"),
+                    np.asarray(self._curves))
+            np.save(self._chunk_file(self.chunks, "ss"),
+                    np.asarray(self._ss))
+            for row, point in enumerate(self._points):
+                self.index[point] = (self.chunks, row)
+            self.chunks += 1
+            self._curves, self._ss, self._points = [], [], []
+
+        points = [[float(p[0]), float(p[1]), float(p[2]), int(p[3]),
+                   int(p[4]), p[5], c, r] for p, (c, r) in self.index.items()]
+        with open(os.path.join(self.folder, "index.json.tmp"), "w") as f:
+            json.dump({"chunks": self.chunks, "points": points}, f)
+        os.replace(os.path.join(self.folder, "index.json.tmp"),
+                   os.path.join(self.folder, "index.json"))
+
+    def load_chunk(self, chunk: int) -> tuple:
+        """
+        :return: memory-mapped (curves, steady states) of chunk
+        """
+        return (np.load(self._chunk_file(chunk, "curves"), mmap_mode="r"),
+                np.load(self._chunk_file(chunk, "ss"), mmap_mode="r"))
+
+    def get(self, point: tuple) -> tuple:
+        """
+        :return: (time, trajectory, steady state) of single grid point
+        """
+        chunk, row = self.index[tuple(point)]
+        curves, ss = self.load_chunk(chunk)
+        return TRAJECTORY_TIME, np.asarray(curves[row]), np.asarray(ss[row])
+
+    def apply(self, metric) -> dict:
+        """
+        Calculates metric for every archived grid point, one chunk at a time
+        :param metric: function(time, curves, ss) which takes time array,
+        curves of shape (n, TRAJECTORY_SAMPLES, 8) and steady states of
+        shape (n, 8) and returns array of n values
+        :return: dictionary of grid point and metric value
+        """
+        by_chunk = {}
+        for point, (chunk, row) in self.index.items():
+            by_chunk.setdefault(chunk, []).append((row, point))
+        output = {}
+        for chunk in by_chunk:
+            curves, ss = self.load_chunk(chunk)
+            values = metric(TRAJECTORY_TIME, curves, ss)
+            for row, point in by_chunk[chunk]:
+                output[point] = values[row]
+        return output
+
+
+def time_to_fraction(lipid_index: int, fraction: float):
+    """
+    Example metric: time at which lipid first crosses given fraction of
+    its steady state (NOT_RECOVERED if it never does)
+    :return: function which can be used with TrajectoryArchive.apply
+    """
+
+    def metric(time, curves, ss):
+        crossed = curves[:, :, lipid_index] > (
+                ss[:, None, lipid_index] * fraction)
+        first = np.argmax(crossed, axis=1)
+        values = time[first]
+        values[~crossed.any(axis=1)] = NOT_RECOVERED
+        return values
+
+    return metric
@@ -0,0 +1,300 @@
+"""
+Distributed feedback scan using SQLite work queue.
+
+Publisher calculates scaled enzymes and steady state without feedback
+once and stores them in database together with chunks of scan grid.
+Workers (on any node which can access database file) lease chunks, solve
+them and store records back. Worker can join or leave any time; lease of
+dead worker expires after QUEUE_LEASE_TIME and its chunk is given to other
+worker. Points which exceed their solve budget are added back as single
+point tasks of slow lane, which are leased only after all tasks of main
+lane. Results are collected in the output file once all chunks are done.
+
+Scan settings of publisher are stored with the queue and logged like in
+scan_single_feedback. Worker refuses to start if its own settings are
+different.
+
+Note: SQLite locking on network file systems can be unreliable. Use
+shared storage which supports POSIX locks. Lease times are based on wall
+clock, hence clocks of nodes should be synchronized.
+"""
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from analysis.feedback_scaling import *
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Single points which exceeded solve budget are retried in slow lane after
+# all tasks of main lane are leased
+LANE_MAIN = "main"
+LANE_SLOW = "slow"
+
+
+def _connect(database: str) -> sqlite3.Connection:
+    con = sqlite3.connect(database, timeout=60, isolation_level=None)
+    con.execute("PRAGMA busy_timeout = 60000")
+    return con
+
+
+def publish_scan(filename: str, system: str, database: str,
+                 chunk_size: int = QUEUE_CHUNK_SIZE,
+                 plan: ScanPlan = None) -> int:
+    """
+    Creates work queue for single feedback scan
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param database: SQLite database file (should not exist)
+    :param chunk_size: number of grid points in single task
+    :param plan: scan plan or its shard (default is get_scan_plan())
+    :return: number of tasks
+    """
+    if plan is None:
+        plan = get_scan_plan()
+    if os.path.exists(database):
+        raise Exception("Queue %s already exists" % database)
+    settings = get_scan_settings(system, plan)
+    LOG.info(json.dumps(settings, sort_keys=True))
+    enzymes = get_scaled_enzymes(filename, system)
+    init_con, no_feed_ss = get_no_feedback_ss(enzymes, system, validate=True)
+    meta = {
+        "UID": CURRENT_JOB,
+        "system": system,
+        "enzymes": {e: enzymes[e].properties for e in enzymes},
+        "init_con": list(init_con),
+        "no_feed_ss": list(no_feed_ss),
+        "plan": plan.to_dict(),
+        "settings": settings}
+
+    con = _connect(database)
+    con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    con.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, start INTEGER, "
+                "stop INTEGER, status TEXT, worker TEXT, lease_until REAL, "
+                "attempts INTEGER DEFAULT 0, lane TEXT DEFAULT '%s')" %
+                LANE_MAIN)
+    con.execute("CREATE TABLE results (task_id INTEGER, record TEXT)")
+    con.execute("BEGIN")
+    con.executemany("INSERT INTO meta VALUES (?, ?)",
+                    [(k, json.dumps(meta[k])) for k in meta])
+    con.executemany(
+        "INSERT INTO tasks (start, stop, status) VALUES (?, ?, ?)",
+        [(i, min(i + chunk_size, plan.stop), STATUS_PENDING) for i in
+         range(plan.start, plan.stop, chunk_size)])
+    con.execute("COMMIT")
+    tasks = con.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+    con.close()
+    LOG.info("Published scan %s with %d tasks in %s" % (CURRENT_JOB, tasks,
+                                                         database))
+    return tasks
+
+
+def _lease_task(con: sqlite3.Connection, worker: str,
+                lease_time: float, max_attempts: int):
+    """
+    Leases pending task or task whose lease has expired
+    :return: (task id, start, stop, lane) or None if nothing can be
+    leased
+    """
+    now = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        # Tasks of dead workers which are already tried enough are failed
+        con.execute("UPDATE tasks SET status = ? WHERE status = ? AND "
+                    "lease_until < ? AND attempts >= ?",
+                    (STATUS_FAILED, STATUS_LEASED, now, max_attempts))
+        task = con.execute(
+            "SELECT id, start, stop, lane FROM tasks WHERE status = ? OR "
+            "(status = ? AND lease_until < ?) ORDER BY lane = ?, id LIMIT 1",
+            (STATUS_PENDING, STATUS_LEASED, now, LANE_SLOW)).fetchone()
+        if task is not None:
+            con.execute("UPDATE tasks SET status = ?, worker = ?, "
+                        "lease_until = ?, attempts = attempts + 1 WHERE "
+                        "id = ?", (STATUS_LEASED, worker, now + lease_time,
+                                   task[0]))
+        con.execute("COMMIT")
+    except sqlite3.Error:
+        con.execute("ROLLBACK")
+        raise
+    return task
+
+
+def _renew_lease(con: sqlite3.Connection, task_id: int, worker: str,
+                 lease_time: float) -> bool:
+    cur = con.execute("UPDATE tasks SET lease_until = ? WHERE id = ? AND "
+                      "worker = ? AND status = ?",
+                      (time.time() + lease_time, task_id, worker,
+                       STATUS_LEASED))
+    return cur.rowcount == 1
+
+
+def _complete_task(con: sqlite3.Connection, task_id: int, worker: str,
+                   records: list, slow_lane: list = None) -> bool:
+    """
+    Stores results only if task is still leased by this worker
+    :param slow_lane: indices of points which should be retried in slow
+    lane
+    """
+    con.execute("BEGIN IMMEDIATE")
+    cur = con.execute("UPDATE tasks SET status = ? WHERE id = ? AND "
+                      "worker = ? AND status = ?",
+                      (STATUS_DONE, task_id, worker, STATUS_LEASED))
+    if cur.rowcount != 1:
+        con.execute("ROLLBACK")
+        return False
+    con.executemany("INSERT INTO results VALUES (?, ?)",
+                    [(task_id, json.dumps(r, sort_keys=True)) for r in
+                     records])
+    if slow_lane:
+        con.executemany(
+            "INSERT INTO tasks (start, stop, status, lane) VALUES "
+            "(?, ?, ?, ?)", [(i, i + 1, STATUS_PENDING, LANE_SLOW) for i in
+                             slow_lane])
+    con.execute("COMMIT")
+    return True
+
+
+def _get_meta(con: sqlite3.Connection) -> dict:
+    return {k: json.loads(v) for k, v in
+            con.execute("SELECT key, value FROM meta").fetchall()}
+
+
+def check_settings(meta: dict) -> None:
+    """
+    Raises exception if local scan settings are different from settings
+    with which queue was published
+    """
+    plan = ScanPlan.from_dict(meta["plan"])
+    local = json.loads(json.dumps(get_scan_settings(meta["system"], plan)))
+    published = meta["settings"]
+    different = sorted(k for k in set(local) | set(published)
+                       if k != "UID" and local.get(k) != published.get(k))
+    if len(different) > 0:
+        raise Exception("Local settings are different from queue %s : %s"
+                        % (meta["UID"], ", ".join(different)))
+
+
+def get_queue_status(database: str) -> dict:
+    """
+    :return: number of tasks in each status
+    """
+    con = _connect(database)
+    status = dict(con.execute("SELECT status, COUNT(*) FROM tasks GROUP BY "
+                              "status").fetchall())
+    con.close()
+    return status
+
+
+def run_worker(database: str, lease_time: float = QUEUE_LEASE_TIME,
+               max_attempts: int = QUEUE_MAX_ATTEMPTS,
+               wait: bool = True) -> int:
+    """
+    Solves tasks from work queue until all tasks are finished
+    :param database: SQLite database created by publish_scan
+    :param lease_time: time (in seconds) for which task is leased
+    :param max_attempts: task is failed after these many leases
+    :param wait: if True, worker waits for leased tasks of other workers
+    (they might die) instead of exiting
+    :return: number of tasks completed by this worker
+    """
+    worker = "%s:%d" % (socket.gethostname(), os.getpid())
+    con = _connect(database)
+    meta = _get_meta(con)
+    try:
+        check_settings(meta)
+    except Exception:
+        con.close()
+        raise
+    system = meta["system"]
+    enzymes = convert_to_enzyme(meta["enzymes"])
+    init_con = meta["init_con"]
+    no_feed_ss = np.asarray(meta["no_feed_ss"])
+    plan = ScanPlan.from_dict(meta["plan"])
+    no_feed_recovery = get_no_feedback_recovery(system, enzymes, no_feed_ss)
+    completed = 0
+    while True:
+        task = _lease_task(con, worker, lease_time, max_attempts)
+        if task is None:
+            status = dict(con.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ).fetchall())
+            if not wait or status.get(STATUS_LEASED, 0) == 0:
+                break
+            time.sleep(QUEUE_POLL_INTERVAL)
+            continue
+
+        task_id, start, stop, lane = task
+        budget_factor = 1
+        task_lease = lease_time
+        if lane == LANE_SLOW:
+            budget_factor = SLOW_LANE_BUDGET_FACTOR
+            task_lease = lease_time * SLOW_LANE_BUDGET_FACTOR
+            _renew_lease(con, task_id, worker, task_lease)
+        records = []
+        slow_lane = []
+        for index in range(start, stop):
+            data = solve_feedback_point(system, enzymes, init_con,
+                                        no_feed_ss, *plan.point(index),
+                                        no_feed_recovery=no_feed_recovery,
+                                        budget_factor=budget_factor)
+            if data is not None:
+                records.append(data)
+                if lane == LANE_MAIN and is_budget_record(data):
+                    slow_lane.append(index)
+            if not _renew_lease(con, task_id, worker, task_lease):
+                # Lease is lost (taken by other worker)
+                break
+        else:
+            if _complete_task(con, task_id, worker, records, slow_lane):
+                completed += 1
+    con.close()
+    LOG.info("Worker %s completed %d tasks" % (worker, completed))
+    return completed
+
+
+def collect_results(database: str) -> int:
+    """
+    Writes all results in output file (in order of scan grid)
+    :param database: SQLite database created by publish_scan
+    :return: number of records written
+    """
+    con = _connect(database)
+    meta = _get_meta(con)
+    status = dict(con.execute("SELECT status, COUNT(*) FROM tasks GROUP BY "
+                              "status").fetchall())
+    if status.get(STATUS_FAILED, 0) > 0:
+        LOG.info("%d tasks failed in queue %s" % (status[STATUS_FAILED],
+                                                  database))
+    # Records are logged with UID of published scan (together with its
+    # settings so that output can be validated, see helper.get_run_settings)
+    uid = meta["UID"]
+    LOG.info(json.dumps(meta["settings"], sort_keys=True), extra={"uid": uid})
+    count = 0
+    for (record,) in con.execute(
+            "SELECT results.record FROM results JOIN tasks ON "
+            "results.task_id = tasks.id ORDER BY tasks.start, tasks.id, "
+            "results.rowid"):
+        OUTPUT.info(record, extra={"uid": uid})
+        count += 1
+    con.close()
+    return count
+
+
+def run_local(database: str, processes: int = None) -> None:
+    """
+    Runs workers in multiple local processes
+    :param database: SQLite database created by publish_scan
+    :param processes: number of workers (default: number of cores)
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    workers = [multiprocessing.Process(target=run_worker, args=(database,))
+               for _ in range(processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
@@ -1,21 +1,64 @@
-from analysis.feedback_scaling import scan_single_feedback
+from analysis.feedback_scaling import scan_single_feedback, \
+    estimate_scan_runtime
 from analysis.feedback_visualize import visualize
+from analysis.live_analysis import follow_scan
+from analysis.report import render_report
+from analysis.sensitivity import scan_sensitivity
+from analysis.trajectory import TrajectoryArchive
+from analysis.work_queue import publish_scan, run_worker, collect_results
 from constants.namespace import S_OPEN_2
 from test import plot, check_patp
+from utils.log import CURRENT_JOB
 
 CURRENT_FILE = "best_para.txt"
+QUEUE_FILE = "output/queue.db"
+SCRIPT_LOG = "output/script.log"
 
 
 def scan_single():
     scan_single_feedback(CURRENT_FILE, S_OPEN_2)
 
 
+def scan_with_trajectories():
+    archive = TrajectoryArchive("output/trajectories/%s" % CURRENT_JOB)
+    scan_single_feedback(CURRENT_FILE, S_OPEN_2, archive)
+
+
+def sensitivity():
+    scan_sensitivity(CURRENT_FILE, S_OPEN_2)
+
+
+def estimate():
+    estimate_scan_runtime(CURRENT_FILE, S_OPEN_2)
+
+
 def test():
     plot(CURRENT_FILE, S_OPEN_2)
 
 
 def vis():
-    visualize("output/output.log", S_OPEN_2)
+    visualize("output/output.log", S_OPEN_2, SCRIPT_LOG)
+
+
+def report():
+    render_report("output/output.log", S_OPEN_2, "output/report",
+                  script_log=SCRIPT_LOG)
+
+
+def live():
+    follow_scan("output/output.log", S_OPEN_2, script_log=SCRIPT_LOG)
+
+
+def publish():
+    publish_scan(CURRENT_FILE, S_OPEN_2, QUEUE_FILE)
+
+
+def worker():
+    run_worker(QUEUE_FILE)
+
+
+def collect():
+    collect_results(QUEUE_FILE)
 
 
 if __name__ == "__main__":
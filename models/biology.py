@@ -1,3 +1,5 @@
+import numpy as np
+
 from constants.namespace import *
 
 
@@ -84,8 +86,23 @@ class Enzyme:
             else:
                 return self.k * fed_factor  # For source
 
+    def get_substrate(self, flux: float) -> float:
+        """
+        Inverse of regular reaction (without feedback)
+        :param flux: product amount (can be array if k and v are arrays)
+        :return: substrate concentration at which enzyme gives this flux
+        """
+        if self.kinetics == KINETIC_MASS_ACTION:
+            return flux / self.k
+        elif self.kinetics == KINETIC_MICHAELIS_MENTEN:
+            if np.any(np.asarray(flux) >= self.v):
+                raise Exception("Flux %s through %s is not below its Vmax %s"
+                                % (flux, self.name, self.v))
+            return flux * self.k / (self.v - flux)
+        raise Exception("Unknown kinetics : %s" % self.kinetics)
+
     def stimulate(self, factor):
-        if self.name is not E_PLC:
+        if self.name != E_PLC:
             raise Exception("Only PLC can be stimulated")
         if self.kinetics == KINETIC_MASS_ACTION:
             self.k *= factor
@@ -1,3 +1,5 @@
+import numpy as np
+
 from constants.namespace import *
 from models.biology import Enzyme
 
@@ -47,3 +49,68 @@ def get_equations(concentrations: list, time: tuple, *args) -> list:
                                                                  feed_para)
 
     return [d_pmpi, d_pi4p, d_pip2, d_dag, d_pmpa, d_erpa, d_cdpdag, d_erpi]
+
+
+def _get_branch_substrate(first: Enzyme, second: Enzyme,
+                          flux: float) -> float:
+    """
+    Substrate concentration at which two enzymes acting on same substrate
+    together give flux. Every rate is n1*s/(d0 + d1*s), hence their sum is
+    quadratic equation a*s^2 + b*s + c = 0 with single positive root.
+    Works element-wise if enzyme parameters are arrays.
+    """
+    para = []
+    for e in [first, second]:
+        if e.kinetics == KINETIC_MASS_ACTION:
+            para.append((e.k, 1, 0))
+        elif e.kinetics == KINETIC_MICHAELIS_MENTEN:
+            para.append((e.v, e.k, 1))
+        else:
+            raise Exception("Unknown kinetics : %s" % e.kinetics)
+    (n1, p0, p1), (n2, q0, q1) = para
+    a = n1 * q1 + n2 * p1 - flux * p1 * q1
+    b = n1 * q0 + n2 * p0 - flux * (p0 * q1 + p1 * q0)
+    c = -flux * p0 * q0
+    if np.any(a < 0) or np.any((a == 0) & (b <= 0)):
+        raise Exception("Flux %s through %s and %s is not below their "
+                        "total Vmax" % (flux, first.name, second.name))
+    disc = np.sqrt(b * b - 4 * a * c)
+    # Form without cancellation is chosen by sign of b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b >= 0, 2 * c / (-b - disc), (-b + disc) / (2 * a))
+
+
+def get_steady_state(enzyme_list: dict) -> list:
+    """
+    Steady state without feedback from flux balance. Source flux leaves
+    only through sink, which fixes DAG. DAGK flux is split between LAZA
+    and PATP, which fixes PMPA, and every enzyme of the cycle from CDS to
+    PLC carries PATP flux plus source flux. Every concentration is then
+    obtained by inverting its enzyme (Enzyme.get_substrate). Enzyme
+    parameters can be arrays (e.g. sweep of scaling), then every
+    concentration is array of same shape.
+    Raises exception if some flux is not below Vmax of its enzyme (there is
+    no steady state for such parameter set).
+    :param enzyme_list: dict of enzymes
+    :return: steady state concentrations (same order as get_equations)
+    """
+    pitp = enzyme_list.get(E_PITP)  # type: Enzyme
+    pip5k = enzyme_list.get(E_PIP5K)  # type: Enzyme
+    plc = enzyme_list.get(E_PLC)  # type: Enzyme
+    pi4k = enzyme_list.get(E_PI4K)  # type: Enzyme
+    dagk = enzyme_list.get(E_DAGK)  # type: Enzyme
+    laza = enzyme_list.get(E_LAZA)  # type: Enzyme
+    patp = enzyme_list.get(E_PATP)  # type: Enzyme
+    cds = enzyme_list.get(E_CDS)  # type: Enzyme
+    pis = enzyme_list.get(E_PIS)  # type: Enzyme
+    sink = enzyme_list.get(E_SINK)  # type: Enzyme
+    source = enzyme_list.get(E_SOURCE)  # type: Enzyme
+
+    influx = source.react_with(None)
+    dag = sink.get_substrate(influx)
+    pmpa = _get_branch_substrate(laza, patp, dagk.react_with(dag))
+    cycle = patp.react_with(pmpa) + influx
+
+    return [pi4k.get_substrate(cycle), pip5k.get_substrate(cycle),
+            plc.get_substrate(cycle), dag, pmpa, cds.get_substrate(cycle),
+            pis.get_substrate(cycle), pitp.get_substrate(cycle)]
@@ -2,6 +2,7 @@ import matplotlib.pylab as plt
 import matplotlib.ticker as ticker
 
 from analysis.analysis_settings import *
+from analysis.feedback_scaling import get_timings
 from analysis.helper import *
 
 
@@ -26,12 +27,22 @@ def get_scaled_enzymes(filename: str, system: str) -> dict:
     return enzymes
 
 
+def get_scaling_ss(enzymes: dict, system: str):
+    """
+    Steady state used for scaling (flux balance if system has it)
+    """
+    ss = get_flux_balance_ss(system, enzymes)
+    if ss is None:
+        init_con = get_random_concentrations(200, system)
+        initial_time = np.linspace(0, 2000, 5000)
+        ss = odeint(get_equations(system), init_con, initial_time,
+                    args=(enzymes, None))[-1]
+    return ss
+
+
 def get_real_value_enzymes(filename: str, system: str, total_pi: float):
     enzymes = get_enzymes(filename)
-    init_con = get_random_concentrations(200, system)
-    initial_time = np.linspace(0, 2000, 5000)
-    ss = odeint(get_equations(system), init_con, initial_time,
-                args=(enzymes, None))[-1]
+    ss = get_scaling_ss(enzymes, system)
     plc_base = enzymes[E_PLC].v
 
     total_lipid = 1.2767 * total_pi
@@ -45,6 +56,93 @@ def get_real_value_enzymes(filename: str, system: str, total_pi: float):
     return enzymes
 
 
+def get_real_value_enzyme_sweep(filename: str, system: str,
+                                total_pi_values) -> dict:
+    """
+    Same as get_real_value_enzymes for many values of total PI at once.
+    Scaling steady state is calculated only once and k of every enzyme
+    (except source) becomes array with one value for every total PI.
+    """
+    enzymes = get_enzymes(filename)
+    ss = get_scaling_ss(enzymes, system)
+    plc_base = enzymes[E_PLC].v
+
+    total_lipid = 1.2767 * np.asarray(total_pi_values, dtype=float)
+
+    for e in enzymes:
+        if e != E_SOURCE:
+            enzymes[e].k = enzymes[e].k * total_lipid / sum(ss)
+            enzymes[e].v = enzymes[e].v / plc_base
+        else:
+            enzymes[e].k = enzymes[e].k / plc_base
+    return enzymes
+
+
+def solve_batch(system: str, initial, time_points, enzymes: dict):
+    """
+    Integrates all values of sweep together. Every concentration is array
+    with one value for every total PI. In flattened state, lipids of each
+    value are next to each other, hence Jacobian is banded (values do not
+    interact) and odeint needs only few evaluations to calculate it.
+    :param initial: array of shape (8, number of values)
+    :return: array of shape (time points, 8, number of values)
+    """
+    initial = np.asarray(initial, dtype=float)
+    lipids, size = initial.shape
+    equations = get_equations(system)
+
+    def batch_equations(concentrations, time, *args):
+        rates = equations(list(concentrations.reshape(size, lipids).T),
+                          time, *args)
+        return np.asarray(rates).T.ravel()
+
+    output = odeint(batch_equations, initial.T.ravel(), time_points,
+                    args=(enzymes, None), ml=lipids - 1, mu=lipids - 1)
+    return output.reshape(len(time_points), size, lipids).transpose(0, 2, 1)
+
+
+def sweep_total_pi(filename: str, system: str, total_pi_values) -> list:
+    """
+    Recovery timings without feedback (same phases as in
+    plot_without_feedback) for every value of total PI
+    :param filename: file with parameter set
+    :param system: topology or known model
+    :param total_pi_values: array of total PI values
+    :return: tidy table as list of rows with "total_pi", "lipid",
+    "recovery_point" and "time" (NOT_RECOVERED if point is not reached)
+    """
+    total_pi_values = np.asarray(total_pi_values, dtype=float)
+    size = len(total_pi_values)
+    enzymes = get_real_value_enzyme_sweep(filename, system, total_pi_values)
+    ss = get_flux_balance_ss(system, enzymes)
+    if ss is None:
+        init_con = get_random_concentrations(1, system)
+        initial_time = np.linspace(0, 200, 3000)
+        ss = solve_batch(system, np.repeat(np.asarray(init_con)[:, None],
+                                           size, axis=1), initial_time,
+                         enzymes)[-1]
+
+    buffer_time = np.linspace(0, 2, 50)
+    buffer = solve_batch(system, ss, buffer_time, enzymes)
+
+    stim = give_stimulus(buffer[-1], PERCENTAGE_DEPLETION)
+
+    recovery_time = np.linspace(0, 10, 1000)
+    recovery = solve_batch(system, stim, recovery_time, enzymes)
+
+    table = []
+    for j, total_pi in enumerate(total_pi_values):
+        for i in [I_PIP2, I_PI4P]:
+            timings = get_timings(recovery[:, i, j], buffer[-1][i][j],
+                                  recovery_time)
+            for point, time in zip(RECOVERY_POINTS, timings):
+                table.append({"total_pi": float(total_pi),
+                              "lipid": get_lipid_from_index(i),
+                              "recovery_point": point,
+                              "time": float(time)})
+    return table
+
+
 def plot_without_feedback(filename: str, system: str):
     enzymes = get_real_value_enzymes(filename, system, 3.58)
     init_con = get_random_concentrations(1, system)
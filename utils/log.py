@@ -21,7 +21,8 @@ class AppFilter(logging.Filter):
     """
 
     def filter(self, record):
-        record.uid = CURRENT_JOB
+        # UID can be given explicitly with extra={"uid": ...}
+        record.uid = getattr(record, "uid", CURRENT_JOB)
         return True
 
 